@@ -12,34 +12,323 @@
 
 # ------------------ #
 import os
+import re
 import sys
 import json
 import random
-import base64
+import binascii
+import codecs
 import time
-from math import gcd
+import atexit
+import threading
+import zlib
+from math import ceil, gcd, log, log10, exp
+from array import array
 from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from functools import lru_cache, partial
+from itertools import combinations, islice, product
+from operator import itemgetter
+
+class _LazyModule:
+    """Stands in for an optional module until it is needed. Truth-testing it
+    checks the module exists without importing it; the first attribute access
+    imports it. Either way the global is then swapped for the module or None."""
+    def __init__(self, name, alias):
+        self.name, self.alias = name, alias
+        self.found = None
+
+    def _load(self):
+        try:
+            mod = __import__(self.name)
+        except ImportError:
+            mod = None
+        globals()[self.alias] = mod
+        return mod
+
+    def __bool__(self):
+        if self.found is None:
+            from importlib.util import find_spec
+            self.found = find_spec(self.name) is not None or bool(self._load())
+        return self.found
+
+    def __getattr__(self, attr):
+        mod = self._load()
+        if mod is None: raise ImportError(f"{self.name} is not installed")
+        return getattr(mod, attr)
+
+np = _LazyModule("numpy", "np")  #numpy alone costs more than the rest of startup
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt  #Windows file locking when there's no fcntl
+except ImportError:
+    msvcrt = None
 
 # ------------------ #
 
 STATS_FILE = "cipher_terminal_stats.json"
 DICT_FILE = "dictionary.txt"  #Extra quotes 
+QUADGRAM_FILE = "quadgrams.txt"  #Optional "TION 13168375" style counts
+WORDLIST_FILE = "words.txt"  #Optional one-word-per-line list for the English detector
+
+JOURNAL_FILE = "cipher_terminal_stats.journal"
+STATS_LOCK_FILE = "cipher_terminal_stats.lock"
+STATS_DB = "cipher_terminal_stats.db"
+ATTEMPT_LOG_DIR = "cipher_terminal_attempts"  #One file per column of every attempt
+STATS_BACKEND = os.environ.get("CIPHER_TERMINAL_STATS", "journal")  #json, journal or sqlite
+PUZZLE_FILE = os.environ.get("CIPHER_TERMINAL_PUZZLES")  #Pre-generated puzzles for practice mode
+PLUGIN_DIR = os.environ.get("CIPHER_TERMINAL_PLUGINS")  #Folder of .py files that add ciphers; unset = none
+PLUGIN_GROUP = "cipher_terminal.ciphers"  #Entry point group for installed cipher packages
+
+class FileLock:
+    """Exclusive lock on a side file, shared by every process using the stats."""
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a+")
+        if fcntl:
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        elif msvcrt:
+            # Locks the first byte. LK_LOCK gives up after about 10 seconds,
+            # so keep waiting like flock does.
+            self.f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+        elif msvcrt:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+        self.f.close()
+
+
+class StatsStore:
+    """Where stats live. record() is called once per attempt and should be cheap;
+    save() is called with the whole dict on quit."""
+    def load(self): return {}
+    def record(self, stats, user, cipher_name, correct, hints_used, elapsed_seconds): pass
+    def save(self, stats): pass
+    def flush(self): pass
+
+
+class JsonStore(StatsStore):
+    """The original format: the whole dict rewritten after every attempt."""
+    def __init__(self, path=STATS_FILE):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def record(self, stats, user, cipher_name, correct, hints_used, elapsed_seconds):
+        self.save(stats)
+
+    def save(self, stats):
+        try:
+            self._write(stats)
+        except Exception as e:
+            print("Warning: could not save stats:", e)
+
+    def _write(self, stats):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+class JournalStore(JsonStore):
+    """STATS_FILE as a snapshot plus an append-only journal of attempts.
+    Attempts are buffered and appended in batches under a file lock, so
+    sessions running at the same time all keep their results. The journal
+    is folded back into the snapshot once it grows past compact_bytes."""
+    def __init__(self, path=STATS_FILE, journal=JOURNAL_FILE, lock=STATS_LOCK_FILE,
+                 batch=8, interval=1.0, compact_bytes=1 << 20):
+        super().__init__(path)
+        self.journal = journal
+        self.lock = lock
+        self.batch = batch
+        self.interval = interval
+        self.compact_bytes = compact_bytes
+        self.pending = []
+        self.last_flush = time.time()
+
+    def _replay(self, stats):
+        if not os.path.exists(self.journal): return stats
+        with open(self.journal, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    continue  # torn line from a crash
+                apply_attempt(stats, e["u"], e["c"], e["ok"], e["h"], e["t"])
+        return stats
+
+    def load(self):
+        with FileLock(self.lock):
+            return self._replay(super().load())
+
+    def record(self, stats, user, cipher_name, correct, hints_used, elapsed_seconds):
+        self.pending.append(json.dumps({"u": user, "c": cipher_name, "ok": bool(correct),
+                                        "h": hints_used, "t": elapsed_seconds}) + "\n")
+        if len(self.pending) >= self.batch or time.time() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.pending: return
+        lines, self.pending = "".join(self.pending), []
+        try:
+            with FileLock(self.lock):
+                with open(self.journal, "a+b") as f:
+                    # A crash can leave a torn last line; start on a fresh one
+                    # so this batch isn't glued onto it and skipped.
+                    if f.tell():
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n": lines = "\n" + lines
+                    f.write(lines.encode("utf-8"))
+                if os.path.getsize(self.journal) >= self.compact_bytes:
+                    self._compact()
+        except OSError as e:
+            print("Warning: could not save stats:", e)
+
+    def _compact(self):
+        # Caller holds the lock. Rebuilt from disk, not from this session's
+        # dict, so other sessions' attempts are kept.
+        # Raises if the snapshot can't be written, so the journal is only
+        # emptied once its attempts are safely in the snapshot.
+        stats = self._replay(JsonStore.load(self))
+        self._write(stats)
+        open(self.journal, "w").close()
+
+    def save(self, stats):
+        self.flush()
+        try:
+            with FileLock(self.lock):
+                if os.path.exists(self.journal) and os.path.getsize(self.journal): self._compact()
+        except OSError as e:
+            print("Warning: could not save stats:", e)
+
+
+class SqliteStore(StatsStore):
+    """Stats in SQLite (WAL mode). Each flush is one transaction of UPSERTs that
+    add to the stored counters, so concurrent sessions never overwrite each other."""
+    def __init__(self, path=STATS_DB, batch=8, interval=1.0):
+        import sqlite3
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                user TEXT PRIMARY KEY, total_attempts INTEGER NOT NULL DEFAULT 0,
+                total_correct INTEGER NOT NULL DEFAULT 0, total_hints INTEGER NOT NULL DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS ciphers (
+                user TEXT NOT NULL, cipher TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0, correct INTEGER NOT NULL DEFAULT 0,
+                hints INTEGER NOT NULL DEFAULT 0, fastest REAL, longest REAL,
+                hint_free INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user, cipher));
+        """)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(ciphers)")]
+        if "hint_free" not in columns:
+            self.db.execute("ALTER TABLE ciphers ADD COLUMN hint_free INTEGER NOT NULL DEFAULT 0")
+        self.batch = batch
+        self.interval = interval
+        self.pending = []
+        self.last_flush = time.time()
+        self._import_json()
+
+    def _import_json(self):
+        # First run after switching backends: bring the old JSON stats along.
+        if self.db.execute("SELECT COUNT(*) FROM users").fetchone()[0]: return
+        old = JsonStore().load()
+        with self.db:
+            for user, u in old.items():
+                self.db.execute("INSERT INTO users VALUES (?, ?, ?, ?)",
+                                (user, u["total_attempts"], u["total_correct"], u["total_hints"]))
+                for name, c in u["ciphers"].items():
+                    self.db.execute("INSERT INTO ciphers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (user, name, c["attempts"], c["correct"], c["hints"], c["fastest"], c["longest"],
+                                     c.get("hint_free", 0)))
+
+    def load(self):
+        stats = {}
+        for user, attempts, correct, hints in self.db.execute("SELECT * FROM users"):
+            stats[user] = {"total_attempts": attempts, "total_correct": correct, "total_hints": hints, "ciphers": {}}
+        for user, name, attempts, correct, hints, fastest, longest, hint_free in self.db.execute(
+                "SELECT user, cipher, attempts, correct, hints, fastest, longest, hint_free FROM ciphers"):
+            ensure_user(stats, user)
+            stats[user]["ciphers"][name] = {"attempts": attempts, "correct": correct, "hints": hints,
+                                            "fastest": fastest, "longest": longest, "hint_free": hint_free}
+        return stats
+
+    def record(self, stats, user, cipher_name, correct, hints_used, elapsed_seconds):
+        solved = elapsed_seconds if correct else None
+        self.pending.append((user, cipher_name, 1 if correct else 0, hints_used, solved))
+        if len(self.pending) >= self.batch or time.time() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.pending: return
+        rows, self.pending = self.pending, []
+        with self.db:
+            self.db.executemany("""
+                INSERT INTO users VALUES (?, 1, ?, ?)
+                ON CONFLICT(user) DO UPDATE SET total_attempts = total_attempts + 1,
+                    total_correct = total_correct + excluded.total_correct,
+                    total_hints = total_hints + excluded.total_hints
+            """, [(u, ok, h) for u, _, ok, h, _ in rows])
+            self.db.executemany("""
+                INSERT INTO ciphers VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+                ON CONFLICT(user, cipher) DO UPDATE SET attempts = attempts + 1,
+                    correct = correct + excluded.correct, hints = hints + excluded.hints,
+                    hint_free = hint_free + excluded.hint_free,
+                    fastest = CASE WHEN excluded.fastest IS NULL THEN fastest
+                                   WHEN fastest IS NULL OR excluded.fastest < fastest THEN excluded.fastest
+                                   ELSE fastest END,
+                    longest = CASE WHEN excluded.longest IS NULL THEN longest
+                                   WHEN longest IS NULL OR excluded.longest > longest THEN excluded.longest
+                                   ELSE longest END
+            """, [(u, c, ok, h, t, t, 1 if ok and not h else 0) for u, c, ok, h, t in rows])
+
+    def save(self, stats):
+        self.flush()
+
+STATS_STORES = {"json": JsonStore, "journal": JournalStore, "sqlite": SqliteStore}
+_stats_store = None
+
+def get_stats_store():
+    global _stats_store
+    if _stats_store is None:
+        _stats_store = STATS_STORES[STATS_BACKEND]()
+        atexit.register(_stats_store.flush)
+    return _stats_store
 
 def load_stats():
-    if not os.path.exists(STATS_FILE):
-        return {}
-    try:
-        with open(STATS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    return get_stats_store().load()
 
 def save_stats(stats):
-    try:
-        with open(STATS_FILE, "w", encoding="utf-8") as f:
-            json.dump(stats, f, indent=2)
-    except Exception as e:
-        print("Warning: could not save stats:", e)
+    get_stats_store().save(stats)
 
 # ------------------ #
 
@@ -125,37 +414,556 @@ class PhraseManager:
         "DEBUGGING IS TWICE AS HARD AS WRITING THE CODE"
     ]
 
+    # Letter-count ranges for get_phrase(difficulty=...).
+    DIFFICULTY = {"easy": (0, 25), "medium": (26, 45), "hard": (46, None)}
+
+    _index = None
+    _internal = None
+    _lock = threading.Lock()
+
     @staticmethod
-    def get_phrase():
-        phrase_pool = list(PhraseManager.INTERNAL_LIBRARY)
+    def _build_index(path, stat):
+        """Byte offset and letter count of every non-blank line, ordered by letter count."""
+        entries = []
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                stripped = line.strip()
+                if stripped:
+                    entries.append((len(stripped.translate(None, _NON_LETTER_BYTES)), offset))
+                offset += len(line)
+        entries.sort()
+        return {
+            "stamp": (path, stat.st_mtime_ns, stat.st_size),
+            "lengths": array('q', [n for n, _ in entries]),
+            "offsets": array('q', [o for _, o in entries]),
+        }
 
-        if os.path.exists(DICT_FILE):
-            try:
-                with open(DICT_FILE, "r", encoding="utf-8") as f:
-                    external_lines = [line.strip().upper() for line in f if line.strip()]
-                    
-                    phrase_pool.extend(external_lines)
-            except Exception:
-                pass
+    @staticmethod
+    def _load_index():
+        """The DICT_FILE index, rebuilt only when the file's mtime or size changes."""
+        try:
+            stat = os.stat(DICT_FILE)
+        except OSError:
+            return None
+        with PhraseManager._lock:
+            index = PhraseManager._index
+            if index is None or index["stamp"] != (DICT_FILE, stat.st_mtime_ns, stat.st_size):
+                try:
+                    index = PhraseManager._build_index(DICT_FILE, stat)
+                except OSError:
+                    return None
+                PhraseManager._index = index
+            return index
 
-        return random.choice(phrase_pool)
+    @staticmethod
+    def _internal_index():
+        if PhraseManager._internal is None:
+            pairs = sorted((len(sanitize_letters(p)), p) for p in PhraseManager.INTERNAL_LIBRARY)
+            PhraseManager._internal = ([n for n, _ in pairs], [p for _, p in pairs])
+        return PhraseManager._internal
+
+    @staticmethod
+    def get_phrase(min_len=None, max_len=None, difficulty=None):
+        """Random phrase from the library and DICT_FILE, optionally limited to a
+        letter count range or a DIFFICULTY name. Lines are read by offset, so
+        the cost doesn't grow with the size of the file."""
+        if difficulty is not None:
+            min_len, max_len = PhraseManager.DIFFICULTY[difficulty]
+        lo = 0 if min_len is None else min_len
+        hi = sys.maxsize if max_len is None else max_len
+
+        int_lengths, int_phrases = PhraseManager._internal_index()
+        i0, i1 = bisect_left(int_lengths, lo), bisect_right(int_lengths, hi)
+        index = PhraseManager._load_index()
+        e0 = e1 = 0
+        if index is not None:
+            e0, e1 = bisect_left(index["lengths"], lo), bisect_right(index["lengths"], hi)
+
+        total = (i1 - i0) + (e1 - e0)
+        if total == 0: raise ValueError("No phrases match that length")
+        pick = random.randrange(total)
+        if pick < i1 - i0:
+            return int_phrases[i0 + pick]
+        try:
+            with open(DICT_FILE, "rb") as f:
+                f.seek(index["offsets"][e0 + pick - (i1 - i0)])
+                return f.readline().decode("utf-8").strip().upper()
+        except (OSError, UnicodeDecodeError):
+            if i1 > i0: return random.choice(int_phrases[i0:i1])
+            raise
 
 # ------------------ #
 
 ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_NON_LETTER_BYTES = bytes(b for b in range(256) if not (65 <= b <= 90 or 97 <= b <= 122))
+_NON_AZ_BYTES = bytes(b for b in range(256) if not 65 <= b <= 90)
+
+_NONLETTERS = re.compile("[^A-Z]+")
+_NONLETTER_SPLIT = re.compile("([^A-Z]+)")
+_NONLETTER_SPLIT_BYTES = re.compile(b"([^A-Z]+)")
+
+# Every cipher also takes bytes-like input and returns bytes. Only ASCII
+# letters count as letters there; other bytes pass through untouched.
+BYTES_TYPES = (bytes, bytearray, memoryview)
+
+def as_bytes(data):
+    return data if isinstance(data, bytes) else bytes(data)
 
 def sanitize_letters(s):
+    if isinstance(s, BYTES_TYPES): return as_bytes(s).translate(None, _NON_LETTER_BYTES).upper()
+    if s.isascii(): return _NONLETTERS.sub("", s.upper())
     return "".join(ch for ch in s.upper() if ch.isalpha())
 
 def preserve_nonletters(s):
+    if isinstance(s, BYTES_TYPES): return as_bytes(s).upper()
+    if s.isascii(): return s.upper()
     return "".join(ch.upper() if ch.isalpha() else ch for ch in s)
 
+def az_letters(s):
+    """Uppercase A-Z letters of s, dropping everything else."""
+    if isinstance(s, BYTES_TYPES): return as_bytes(s).translate(None, _NON_LETTER_BYTES).upper()
+    return _NONLETTERS.sub("", s.upper())
+
+def merge_letters(seq, letters):
+    """Puts transformed letters back between the non-letters of seq."""
+    is_bytes = isinstance(seq, bytes)
+    parts = (_NONLETTER_SPLIT_BYTES if is_bytes else _NONLETTER_SPLIT).split(seq)
+    pos = 0
+    for i in range(0, len(parts), 2):
+        n = len(parts[i])
+        parts[i] = letters[pos:pos+n]
+        pos += n
+    return (b"" if is_bytes else "").join(parts)
+
+INTO_CHUNK = 1 << 16  #Bytes translated at a time when writing into a caller's buffer
+
+def out_view(out, size):
+    """The first size bytes of the caller's writable buffer, as a memoryview."""
+    view = memoryview(out).cast("B")
+    if size > len(view): raise ValueError(f"Output buffer too small: need {size} bytes")
+    return view[:size]
+
+def write_into(out, result):
+    """Copies result into the caller's writable buffer. Returns the byte count."""
+    out_view(out, len(result))[:] = result
+    return len(result)
+
+@lru_cache(maxsize=None)
+def modinv_table(m):
+    """table[a] is the inverse of a mod m, or None if it has none."""
+    table = [None] * m
+    for a in range(m):
+        for x in range(1, m):
+            if (a * x) % m == 1:
+                table[a] = x
+                break
+    return table
+
 def modinv(a, m=26):
-    a = a % m
-    for x in range(1, m):
-        if (a * x) % m == 1:
-            return x
-    raise ValueError("No modular inverse")
+    x = modinv_table(m)[a % m]
+    if x is None: raise ValueError("No modular inverse")
+    return x
+
+HILL_INVERSE_CACHE = 256
+HILL_UNIFORM_MAX_N = 3  #Largest Hill key drawn uniformly (by rejection) rather than as P*L*U
+
+def _inverse_mod_prime(matrix, p):
+    """Gauss-Jordan inverse mod a prime p."""
+    n = len(matrix)
+    inv = modinv_table(p)
+    rows = [[x % p for x in row] + [1 if i == j else 0 for j in range(n)] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next((r for r in range(col, n) if rows[r][col]), None)
+        if pivot is None: raise ValueError("Matrix not invertible")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        f = inv[rows[col][col]]
+        rows[col] = [x * f % p for x in rows[col]]
+        for r in range(n):
+            g = rows[r][col]
+            if r != col and g:
+                rows[r] = [(x - g * y) % p for x, y in zip(rows[r], rows[col])]
+    return [row[n:] for row in rows]
+
+@lru_cache(maxsize=HILL_INVERSE_CACHE)
+def hill_inverse(matrix):
+    """Inverse of a (tuple-of-tuples) matrix mod 26. 26 isn't prime, so it is
+    inverted mod 2 and mod 13 and the two are joined: x = 13a + 14b (mod 26)."""
+    m2 = _inverse_mod_prime(matrix, 2)
+    m13 = _inverse_mod_prime(matrix, 13)
+    return tuple(tuple((13 * a + 14 * b) % 26 for a, b in zip(r2, r13)) for r2, r13 in zip(m2, m13))
+
+def matmul_mod(a, b, m=26):
+    return [[sum(x * y for x, y in zip(row, col)) % m for col in zip(*b)] for row in a]
+
+def shift_map(shift):
+    r = shift % 26
+    return {ALPHABET[i]: ALPHABET[(i + r) % 26] for i in range(26)}
+
+def invert_map(mapping):
+    return {v: k for k, v in mapping.items()}
+
+def freeze_key(key):
+    """Hashable form of a key (matrices and maps become tuples) for caching."""
+    if isinstance(key, dict): return tuple((k, freeze_key(v)) for k, v in key.items())
+    if isinstance(key, (list, tuple)): return tuple(freeze_key(k) for k in key)
+    return key
+
+class LRUCache:
+    """Bounded mapping that drops the least recently used entry when full."""
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data: return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+    def __len__(self): return len(self._data)
+
+# ------------------ #
+# Optional NumPy engine: whole-array versions of the per-letter loops.
+# Used automatically for texts of NUMPY_MIN_SIZE characters or more and by
+# PreparedKey.batch; without NumPy everything runs on the plain Python paths.
+
+NUMPY_MIN_SIZE = 1 << 14
+
+def _codes(s):
+    """Text as a writable code array: uint8 for ASCII, uint32 code points otherwise."""
+    if s.isascii(): return np.frombuffer(s.encode("ascii"), dtype=np.uint8).copy()
+    return np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32).copy()
+
+def _text(arr):
+    if arr.dtype == np.uint8: return arr.tobytes().decode("ascii")
+    return arr.tobytes().decode("utf-32-le")
+
+def split_lengths(s, lengths):
+    out, pos = [], 0
+    for n in lengths:
+        out.append(s[pos:pos+n])
+        pos += n
+    return out
+
+def _is_letter_map(mapping):
+    return all(isinstance(k, str) and isinstance(v, str) and len(k) == len(v) == 1
+               and k in ALPHABET and v in ALPHABET for k, v in mapping.items())
+
+def np_shift_letters(seqs, shifts, offset=0):
+    """Adds a repeating shift vector to the A-Z letters of uppercased sequences.
+    The keystream restarts for every sequence. Returns (results, letters per result)."""
+    arr = _codes("".join(seqs))
+    mask = (arr >= 65) & (arr <= 90)
+    k = np.asarray(shifts, dtype=np.int16) % 26
+    vals = arr[mask].astype(np.int16) - 65
+    if len(seqs) == 1:
+        counts = [int(vals.size)]
+        ks = np.resize(np.roll(k, -(offset % k.size)), vals.size)
+    else:
+        lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+        owner = np.repeat(np.arange(len(seqs)), lengths)[mask]
+        per_msg = np.bincount(owner, minlength=len(seqs))
+        pos = np.arange(owner.size) - np.repeat(np.cumsum(per_msg) - per_msg, per_msg)
+        ks = k[(pos + offset) % k.size]
+        counts = per_msg.tolist()
+    arr[mask] = (vals + ks) % 26 + 65
+    return split_lengths(_text(arr), map(len, seqs)), counts
+
+def np_map_letters(seqs, mapping):
+    """Applies a 26-letter substitution to uppercased sequences with one table lookup."""
+    arr = _codes("".join(seqs))
+    lut = np.arange(26, dtype=np.uint8) + 65
+    for a, b in mapping.items(): lut[ord(a) - 65] = ord(b)
+    if arr.dtype == np.uint8:
+        full = np.arange(256, dtype=np.uint8)
+        full[65:91] = lut
+        arr = full[arr]
+    else:
+        mask = (arr >= 65) & (arr <= 90)
+        arr[mask] = lut[arr[mask] - 65]
+    return split_lengths(_text(arr), map(len, seqs))
+
+def np_hill(letters, matrix):
+    """Multiplies every block of an A-Z string by matrix mod 26.
+    The length must already be a multiple of the matrix size."""
+    m = np.asarray(matrix, dtype=np.int64)
+    blocks = np.frombuffer(letters.encode("ascii"), dtype=np.uint8).reshape(-1, m.shape[0]).astype(np.int64) - 65
+    out = (blocks @ m.T) % 26 + 65
+    return out.astype(np.uint8).tobytes().decode("ascii")
+
+# ------------------ #
+
+class PreparedKey:
+    """A cipher bound to one key. Ciphers with costly key setup subclass this."""
+    def __init__(self, cipher, key):
+        self.cipher = cipher
+        self.key = key
+
+    def encrypt(self, text): return self.cipher.encrypt(text, self.key)
+    def decrypt(self, text): return self.cipher.decrypt(text, self.key)
+
+    def encrypt_into(self, data, out):
+        """Writes the result for bytes-like data into the writable buffer out.
+        Returns the bytes written. Here it is built first and then copied."""
+        return write_into(out, self.encrypt(data))
+
+    def decrypt_into(self, data, out): return write_into(out, self.decrypt(data))
+
+    def batch(self, texts, decrypt=False):
+        """Returns the results for a list of separate messages."""
+        apply = self.decrypt if decrypt else self.encrypt
+        return [apply(t) for t in texts]
+
+    def stream(self, chunks, decrypt=False):
+        """Yields the result for an iterable of text chunks.
+        Ciphers that can't carry state across chunks read everything first."""
+        text = "".join(chunks)
+        yield self.decrypt(text) if decrypt else self.encrypt(text)
+
+
+class TablePrepared(PreparedKey):
+    """Monoalphabetic key compiled into str.translate tables."""
+    def __init__(self, cipher, key, enc_map, dec_map):
+        super().__init__(cipher, key)
+        self.enc_map = enc_map
+        self.dec_map = dec_map
+        self.enc_table = str.maketrans(enc_map)
+        self.dec_table = str.maketrans(dec_map) if dec_map is not None else None
+
+    def _byte_table(self, decrypt):
+        """256-byte table for bytes input; letters are uppercased first, like text."""
+        name = "dec_bytes" if decrypt else "enc_bytes"
+        table = getattr(self, name, None)
+        if table is None:
+            str_table = self.dec_table if decrypt else self.enc_table
+            table = bytearray(range(256))
+            for b in range(128):
+                out = chr(b).upper().translate(str_table)
+                if len(out) != 1 or not out.isascii():
+                    raise ValueError("Key maps letters outside ASCII; use text instead of bytes")
+                table[b] = ord(out)
+            table = bytes(table)
+            setattr(self, name, table)
+        return table
+
+    def encrypt(self, text):
+        if isinstance(text, BYTES_TYPES): return as_bytes(text).translate(self._byte_table(False))
+        return preserve_nonletters(text).translate(self.enc_table)
+
+    def decrypt(self, text):
+        if self.dec_table is None: raise ValueError("Key has no inverse")
+        if isinstance(text, BYTES_TYPES): return as_bytes(text).translate(self._byte_table(True))
+        return preserve_nonletters(text).translate(self.dec_table)
+
+    def _into(self, data, out, decrypt):
+        """Translates bytes straight into out INTO_CHUNK bytes at a time, so the
+        whole result is never held; this measured as fast as one whole translate."""
+        table = self._byte_table(decrypt)
+        src = memoryview(data).cast("B")
+        view = out_view(out, len(src))
+        for i in range(0, len(src), INTO_CHUNK):
+            view[i:i+INTO_CHUNK] = bytes(src[i:i+INTO_CHUNK]).translate(table)
+        return len(src)
+
+    def encrypt_into(self, data, out):
+        if not isinstance(data, BYTES_TYPES): return super().encrypt_into(data, out)
+        return self._into(data, out, False)
+
+    def decrypt_into(self, data, out):
+        if self.dec_table is None: raise ValueError("Key has no inverse")
+        if not isinstance(data, BYTES_TYPES): return super().decrypt_into(data, out)
+        return self._into(data, out, True)
+
+    def stream(self, chunks, decrypt=False):
+        apply = self.decrypt if decrypt else self.encrypt
+        for chunk in chunks:
+            yield apply(chunk)
+
+    def batch(self, texts, decrypt=False):
+        texts = list(texts)
+        mapping = self.dec_map if decrypt else self.enc_map
+        if not np or not texts or mapping is None or not _is_letter_map(mapping):
+            return super().batch(texts, decrypt)
+        return np_map_letters([preserve_nonletters(t) for t in texts], mapping)
+
+
+class VigenerePrepared(PreparedKey):
+    """Keyword compiled into one shift table per key position."""
+    def __init__(self, cipher, key):
+        super().__init__(cipher, key)
+        k = sanitize_letters(key)
+        if not k: raise ValueError("Key must contain letters")
+        self.shifts = [ALPHABET.index(c) for c in k]
+        self.enc_tables = [str.maketrans(shift_map(s)) for s in self.shifts]
+        self.dec_tables = [str.maketrans(shift_map(-s)) for s in self.shifts]
+        az = ALPHABET.encode("ascii")
+        self.enc_byte_tables = [bytes.maketrans(az, "".join(shift_map(s).values()).encode("ascii")) for s in self.shifts]
+        self.dec_byte_tables = [bytes.maketrans(az, "".join(shift_map(-s).values()).encode("ascii")) for s in self.shifts]
+
+    def _signed_shifts(self, decrypt):
+        return [-s for s in self.shifts] if decrypt else self.shifts
+
+    def _apply(self, text, decrypt, offset=0):
+        """Returns (result, letters used); offset is the keystream position to start at."""
+        seq = preserve_nonletters(text)
+        if isinstance(seq, bytes):
+            return self._apply_bytes(seq, decrypt, offset)
+        if len(seq) >= NUMPY_MIN_SIZE and np:
+            outs, counts = np_shift_letters([seq], self._signed_shifts(decrypt), offset)
+            return outs[0], counts[0]
+        tables = self.dec_tables if decrypt else self.enc_tables
+        letters = _NONLETTERS.sub("", seq)
+        n = len(tables)
+        offset %= n
+        if n == 1:
+            out = letters.translate(tables[0])
+        else:
+            parts = list(letters)
+            for i in range(n):
+                parts[i::n] = letters[i::n].translate(tables[(i + offset) % n])
+            out = "".join(parts)
+        if len(out) == len(seq): return out, len(out)
+        return merge_letters(seq, out), len(out)
+
+    def _apply_bytes(self, seq, decrypt, offset):
+        # Columns are translated straight into one preallocated buffer.
+        tables = self.dec_byte_tables if decrypt else self.enc_byte_tables
+        letters = seq.translate(None, _NON_AZ_BYTES)
+        n = len(tables)
+        offset %= n
+        out = bytearray(len(letters))
+        for i in range(n):
+            out[i::n] = letters[i::n].translate(tables[(i + offset) % n])
+        out = bytes(out)
+        if len(out) == len(seq): return out, len(out)
+        return merge_letters(seq, out), len(out)
+
+    def encrypt(self, text): return self._apply(text, False)[0]
+    def decrypt(self, text): return self._apply(text, True)[0]
+
+    def _into(self, data, out, decrypt):
+        """Translates each key column straight into out (a strided numpy view;
+        memoryview's own strided writes are slower than copying) when data is all
+        letters. Anything else needs merge_letters, so it is built and copied."""
+        seq = preserve_nonletters(data)
+        letters = seq.translate(None, _NON_AZ_BYTES)
+        if not np or len(letters) != len(seq): return write_into(out, self._apply_bytes(seq, decrypt, 0)[0])
+        tables = self.dec_byte_tables if decrypt else self.enc_byte_tables
+        view = np.frombuffer(out_view(out, len(seq)), dtype=np.uint8)
+        n = len(tables)
+        for i in range(n):
+            view[i::n] = np.frombuffer(letters[i::n].translate(tables[i]), dtype=np.uint8)
+        return len(seq)
+
+    def encrypt_into(self, data, out):
+        if not isinstance(data, BYTES_TYPES): return super().encrypt_into(data, out)
+        return self._into(data, out, False)
+
+    def decrypt_into(self, data, out):
+        if not isinstance(data, BYTES_TYPES): return super().decrypt_into(data, out)
+        return self._into(data, out, True)
+
+    def stream(self, chunks, decrypt=False):
+        pos = 0
+        for chunk in chunks:
+            out, used = self._apply(chunk, decrypt, pos)
+            pos += used
+            yield out
+
+    def batch(self, texts, decrypt=False):
+        texts = list(texts)
+        if not np or not texts: return super().batch(texts, decrypt)
+        return np_shift_letters([preserve_nonletters(t) for t in texts], self._signed_shifts(decrypt))[0]
+
+
+class HillPrepared(PreparedKey):
+    """n x n key; 2x2 keys are compiled into a digraph lookup table. The
+    inverse comes from the hill_inverse cache on first decrypt."""
+    def __init__(self, cipher, key):
+        key = [list(row) for row in key]  #Cached, so it mustn't see later edits to the caller's matrix
+        super().__init__(cipher, key)
+        self.n = len(key)
+        if any(len(row) != self.n for row in key): raise ValueError("Matrix must be square")
+        self.enc_table = self._digraphs(key) if self.n == 2 else None
+        self.inverse = None
+        self.dec_table = None
+
+    @staticmethod
+    def _digraphs(m):
+        table = {}
+        for i, x in enumerate(ALPHABET):
+            for j, y in enumerate(ALPHABET):
+                table[x + y] = ALPHABET[(m[0][0]*i + m[0][1]*j) % 26] + ALPHABET[(m[1][0]*i + m[1][1]*j) % 26]
+        return table
+
+    def _apply(self, s, table, matrix):
+        if np and (table is None or len(s) >= NUMPY_MIN_SIZE):
+            return np_hill(s, matrix)
+        if table is not None:
+            return "".join([table[s[i:i+2]] for i in range(0, len(s), 2)])
+        n = self.n
+        vals = [ord(ch) - 65 for ch in s]
+        out = []
+        for i in range(0, len(vals), n):
+            block = vals[i:i+n]
+            out.extend(ALPHABET[sum(r * v for r, v in zip(row, block)) % 26] for row in matrix)
+        return "".join(out)
+
+    def _dec_table(self):
+        if self.inverse is None:
+            self.inverse = self.cipher.matrix_det_inv(self.key)
+            if self.n == 2: self.dec_table = self._digraphs(self.inverse)
+        return self.dec_table
+
+    def _blocks(self, text, decrypt):
+        s = az_letters(text)
+        short = -len(s) % self.n
+        if short: s += ('A' if decrypt else 'X') * short
+        return s
+
+    def encrypt(self, text):
+        if isinstance(text, BYTES_TYPES): return self.encrypt(az_letters(text).decode("ascii")).encode("ascii")
+        return self._apply(self._blocks(text, False), self.enc_table, self.key)
+
+    def decrypt(self, text):
+        if isinstance(text, BYTES_TYPES): return self.decrypt(az_letters(text).decode("ascii")).encode("ascii")
+        table = self._dec_table()
+        return self._apply(self._blocks(text, True), table, self.inverse)
+
+    def stream(self, chunks, decrypt=False):
+        # A block can straddle two chunks, so the leftover letters are carried over.
+        table = self._dec_table() if decrypt else self.enc_table
+        matrix = self.inverse if decrypt else self.key
+        carry = ""
+        for chunk in chunks:
+            s = carry + az_letters(chunk)
+            cut = len(s) - len(s) % self.n
+            carry = s[cut:]
+            if cut: yield self._apply(s[:cut], table, matrix)
+        if carry: yield self._apply(carry + ('A' if decrypt else 'X') * (self.n - len(carry)), table, matrix)
+
+    def batch(self, texts, decrypt=False):
+        texts = list(texts)
+        if not np or not texts: return super().batch(texts, decrypt)
+        if decrypt: self._dec_table()
+        seqs = [self._blocks(t, decrypt) for t in texts]
+        out = np_hill("".join(seqs), self.inverse if decrypt else self.key)
+        return split_lengths(out, map(len, seqs))
+
+PREPARED_CACHE_SIZE = 256
+_PREPARED = LRUCache(PREPARED_CACHE_SIZE)
 
 # ------------------ #
 
@@ -181,48 +989,71 @@ class Cipher(ABC):
         """Returns a string representation of the key for display."""
         return str(key)
 
+    def key_space(self):
+        """Returns every key, for ciphers small enough to search exhaustively, else None."""
+        return None
+
+    def prepare(self, key=None):
+        """Returns a reusable PreparedKey for key, cached by (cipher, key)."""
+        cache_key = (self.name, freeze_key(key))
+        prepared = _PREPARED.get(cache_key)
+        if prepared is None:
+            prepared = self._compile(key)
+            _PREPARED.put(cache_key, prepared)
+        return prepared
+
+    def _compile(self, key):
+        """Does the per-key setup. Ciphers without any just bind the key."""
+        return PreparedKey(self, key)
+
+    def encrypt_into(self, data, key, out):
+        """Encrypts bytes-like data into the writable buffer out. Returns the bytes written."""
+        return self.prepare(key).encrypt_into(data, out)
+
+    def decrypt_into(self, data, key, out): return self.prepare(key).decrypt_into(data, out)
+
 # ------------------ #
 
 class Caesar(Cipher):
     def __init__(self): super().__init__("Caesar", "Shift (1-25)")
 
-    def encrypt(self, text, shift):
-        s = preserve_nonletters(text)
-        out = []
-        r = shift % 26
-        for ch in s:
-            if ch.isalpha():
-                out.append(ALPHABET[(ALPHABET.index(ch) + r) % 26])
-            else:
-                out.append(ch)
-        return "".join(out)
+    def _compile(self, shift):
+        enc = shift_map(shift)
+        return TablePrepared(self, shift, enc, invert_map(enc))
 
-    def decrypt(self, text, shift):
-        return self.encrypt(text, -shift)
+    def encrypt(self, text, shift): return self.prepare(shift).encrypt(text)
+    def decrypt(self, text, shift): return self.prepare(shift).decrypt(text)
 
     def generate_key(self): return random.randint(1, 25)
+    def key_space(self): return list(range(1, 26))
 
 
 class ROT13(Cipher):
     def __init__(self): super().__init__("ROT13", "None")
 
-    def encrypt(self, text, key=None):
-        return Caesar().encrypt(text, 13)
+    def _compile(self, key):
+        enc = shift_map(13)
+        return TablePrepared(self, key, enc, enc)
+
+    def encrypt(self, text, key=None): return self.prepare(None).encrypt(text)
 
     def decrypt(self, text, key=None): return self.encrypt(text)
     def generate_key(self): return None
+    def key_space(self): return [None]
 
 
 class Atbash(Cipher):
     def __init__(self): super().__init__("Atbash", "None")
 
-    def encrypt(self, text, key=None):
-        _ATBASH = {a: b for a, b in zip(ALPHABET, reversed(ALPHABET))}
-        s = preserve_nonletters(text)
-        return "".join(_ATBASH[ch] if ch.isalpha() else ch for ch in s)
+    def _compile(self, key):
+        enc = {a: b for a, b in zip(ALPHABET, reversed(ALPHABET))}
+        return TablePrepared(self, key, enc, enc)
+
+    def encrypt(self, text, key=None): return self.prepare(None).encrypt(text)
 
     def decrypt(self, text, key=None): return self.encrypt(text)
     def generate_key(self): return None
+    def key_space(self): return [None]
 
 
 class Vigenere(Cipher):
@@ -233,113 +1064,94 @@ class Vigenere(Cipher):
         if not k: raise ValueError("Key must contain letters")
         return (k * ((length // len(k)) + 1))[:length]
 
-    def encrypt(self, text, key):
-        seq = preserve_nonletters(text)
-        ks = self._keystream(key, len([c for c in seq if c.isalpha()]))
-        out = []
-        ki = 0
-        for ch in seq:
-            if ch.isalpha():
-                shift = ALPHABET.index(ks[ki])
-                out.append(ALPHABET[(ALPHABET.index(ch) + shift) % 26])
-                ki += 1
-            else:
-                out.append(ch)
-        return "".join(out)
+    def _compile(self, key): return VigenerePrepared(self, key)
 
-    def decrypt(self, text, key):
-        seq = preserve_nonletters(text)
-        ks = self._keystream(key, len([c for c in seq if c.isalpha()]))
-        out = []
-        ki = 0
-        for ch in seq:
-            if ch.isalpha():
-                shift = ALPHABET.index(ks[ki])
-                out.append(ALPHABET[(ALPHABET.index(ch) - shift) % 26])
-                ki += 1
-            else:
-                out.append(ch)
-        return "".join(out)
+    def encrypt(self, text, key): return self.prepare(key).encrypt(text)
+    def decrypt(self, text, key): return self.prepare(key).decrypt(text)
 
     def generate_key(self):
         return ''.join(random.choice(ALPHABET) for _ in range(random.randint(3, 8)))
 
 
 class Affine(Cipher):
-    def __init__(self): super().__init__("Affine", "Pair (a, b)")
+    COPRIMES = [x for x in range(1, 26) if gcd(x, 26) == 1]
 
-    def encrypt(self, text, key):
-        a, b = key
-        s = preserve_nonletters(text)
-        out = []
-        for ch in s:
-            if ch.isalpha():
-                x = ALPHABET.index(ch)
-                out.append(ALPHABET[(a * x + b) % 26])
-            else:
-                out.append(ch)
-        return "".join(out)
+    def __init__(self): super().__init__("Affine", "Pair (a, b)")
 
-    def decrypt(self, text, key):
+    def _compile(self, key):
         a, b = key
+        enc = {ALPHABET[x]: ALPHABET[(a * x + b) % 26] for x in range(26)}
         try:
             a_inv = modinv(a, 26)
         except ValueError:
+            return TablePrepared(self, (a, b), enc, None)
+        dec = {ALPHABET[y]: ALPHABET[(a_inv * (y - b)) % 26] for y in range(26)}
+        return TablePrepared(self, (a, b), enc, dec)
+
+    def encrypt(self, text, key): return self.prepare(key).encrypt(text)
+
+    def decrypt(self, text, key):
+        prepared = self.prepare(key)
+        if prepared.dec_table is None:
             return "[Error: Key 'a' has no modular inverse]"
-        s = preserve_nonletters(text)
-        out = []
-        for ch in s:
-            if ch.isalpha():
-                y = ALPHABET.index(ch)
-                out.append(ALPHABET[(a_inv * (y - b)) % 26])
-            else:
-                out.append(ch)
-        return "".join(out)
+        return prepared.decrypt(text)
 
     def generate_key(self):
-        coprimes = [x for x in range(1, 26) if gcd(x, 26) == 1]
-        return (random.choice(coprimes), random.randint(0, 25))
+        return (random.choice(self.COPRIMES), random.randint(0, 25))
+
+    def key_space(self): return [(a, b) for a in self.COPRIMES for b in range(26)]
 
     def format_key(self, key): return f"a={key[0]}, b={key[1]}"
 
 
+RAIL_CACHE_SIZE = 64
+RAIL_CACHE_MAX_LEN = 1 << 16  #Longer messages are gathered without caching
+
+def rail_permutation(length, rails):
+    """perm[i] is the plaintext position of ciphertext letter i. Rail r holds
+    positions r, p-r, p+r, 2p-r, ... for the zigzag period p = 2*(rails-1)."""
+    period = 2 * (rails - 1)
+    perm = []
+    for r in range(rails):
+        down = range(r, length, period)
+        if r == 0 or r == rails - 1:
+            perm.extend(down)
+            continue
+        up = range(period - r, length, period)
+        row = [0] * (len(down) + len(up))
+        row[0::2] = down
+        row[1::2] = up
+        perm.extend(row)
+    return perm
+
+def _rail_gather(length, rails, which):
+    perm = rail_permutation(length, rails)
+    if which:
+        inverse = [0] * length
+        for i, j in enumerate(perm): inverse[j] = i
+        perm = inverse
+    return itemgetter(*perm)
+
+_cached_rail_gather = lru_cache(maxsize=RAIL_CACHE_SIZE)(_rail_gather)
+
+def rail_gather(length, rails, which):
+    """Itemgetter for one (length, rails), encrypt (0) or decrypt (1). Short
+    lengths are cached so repeated messages are a single gather; long ones
+    are rebuilt each time rather than holding a full-length table."""
+    if length > RAIL_CACHE_MAX_LEN: return _rail_gather(length, rails, which)
+    return _cached_rail_gather(length, rails, which)
+
 class RailFence(Cipher):
     def __init__(self): super().__init__("Rail Fence", "Rails (int)")
 
-    def encrypt(self, text, rails):
-        s = sanitize_letters(text)
-        if rails <= 1: return s
-        fence = ['' for _ in range(rails)]
-        row, direction = 0, 1
-        for ch in s:
-            fence[row] += ch
-            row += direction
-            if row == rails - 1 or row == 0: direction *= -1
-        return ''.join(fence)
-
-    def decrypt(self, text, rails):
+    def _gather(self, text, rails, which):
         s = sanitize_letters(text)
-        if rails <= 1: return s
-        pattern = []
-        row, direction = 0, 1
-        for _ in s:
-            pattern.append(row)
-            row += direction
-            if row == rails - 1 or row == 0: direction *= -1
-
-        rows = {r: [] for r in range(rails)}
-        idx = 0
-        for r in range(rails):
-            cnt = pattern.count(r)
-            rows[r] = list(s[idx:idx+cnt])
-            idx += cnt
-
-        pointers = {r:0 for r in range(rails)}
-        out = []
-        for r in pattern:
-            out.append(rows[r][pointers[r]])
-            pointers[r] += 1
-        return ''.join(out)
+        if rails <= 1 or len(s) <= 1: return s
+        moved = rail_gather(len(s), rails, which)(s)
+        return bytes(moved) if isinstance(s, bytes) else ''.join(moved)
+
+    def encrypt(self, text, rails): return self._gather(text, rails, 0)
+    def decrypt(self, text, rails): return self._gather(text, rails, 1)
 
     def generate_key(self): return random.randint(2, 6)
 
@@ -347,14 +1159,12 @@ class RailFence(Cipher):
 class Substitution(Cipher):
     def __init__(self): super().__init__("Substitution", "Map (26 chars)")
 
-    def encrypt(self, text, keymap):
-        s = preserve_nonletters(text)
-        return "".join(keymap.get(ch, ch) for ch in s)
+    def _compile(self, keymap):
+        keymap = dict(keymap)  #Cached, so it mustn't see later edits to the caller's dict
+        return TablePrepared(self, keymap, keymap, invert_map(keymap))
 
-    def decrypt(self, text, keymap):
-        inv = {v: k for k, v in keymap.items()}
-        s = preserve_nonletters(text)
-        return "".join(inv.get(ch, ch) for ch in s)
+    def encrypt(self, text, keymap): return self.prepare(keymap).encrypt(text)
+    def decrypt(self, text, keymap): return self.prepare(keymap).decrypt(text)
 
     def generate_key(self):
         shuffled = list(ALPHABET)
@@ -367,71 +1177,1154 @@ class Substitution(Cipher):
 
 
 class Hill(Cipher):
-    def __init__(self): super().__init__("Hill (2x2)", "Matrix [a,b,c,d]")
+    def __init__(self, n=2):
+        key_desc = "Matrix [a,b,c,d]" if n == 2 else f"Matrix ({n*n} numbers, row by row)"
+        super().__init__(f"Hill ({n}x{n})", key_desc)
+        self.n = n
 
     def matrix_det_inv(self, matrix):
-        a,b = matrix[0]
-        c,d = matrix[1]
-        det = (a*d - b*c) % 26
-        try:
-            invdet = modinv(det, 26)
-        except ValueError:
-            raise ValueError("Matrix not invertible")
-        return [[(d * invdet) % 26, ((-b) * invdet) % 26],
-                [((-c) * invdet) % 26, (a * invdet) % 26]]
+        return [list(row) for row in hill_inverse(freeze_key(matrix))]
 
-    def encrypt(self, text, matrix):
-        s = sanitize_letters(text)
-        if len(s) % 2 == 1: s += 'X'
-        out = []
-        for i in range(0, len(s), 2):
-            v0, v1 = ALPHABET.index(s[i]), ALPHABET.index(s[i+1])
-            c0 = (matrix[0][0]*v0 + matrix[0][1]*v1) % 26
-            c1 = (matrix[1][0]*v0 + matrix[1][1]*v1) % 26
-            out.append(ALPHABET[c0] + ALPHABET[c1])
-        return ''.join(out)
-
-    def decrypt(self, text, matrix):
-        inv = self.matrix_det_inv(matrix)
-        s = sanitize_letters(text)
-        out = []
-        for i in range(0, len(s), 2):
-            v0 = ALPHABET.index(s[i])
-            v1 = ALPHABET.index(s[i+1]) if i+1 < len(s) else 0
-            p0 = (inv[0][0]*v0 + inv[0][1]*v1) % 26
-            p1 = (inv[1][0]*v0 + inv[1][1]*v1) % 26
-            out.append(ALPHABET[p0] + ALPHABET[p1])
-        return ''.join(out)
+    def _compile(self, matrix): return HillPrepared(self, matrix)
+
+    def encrypt(self, text, matrix): return self.prepare(matrix).encrypt(text)
+    def decrypt(self, text, matrix): return self.prepare(matrix).decrypt(text)
 
     def generate_key(self):
-        while True:
-            a,b,c,d = [random.randint(0,25) for _ in range(4)]
-            det = (a*d - b*c) % 26
-            if gcd(det, 26) == 1:
-                return [[a,b],[c,d]]
+        # Small keys: uniform over invertible matrices by redrawing until the
+        # det is a unit (over a quarter of 3x3 draws are). Larger ones use
+        # P*L*U with L unit lower triangular and U upper triangular with a
+        # unit (mod 26) diagonal: always invertible, but not uniform (a first
+        # column always holds a unit).
+        n = self.n
+        if n <= HILL_UNIFORM_MAX_N:
+            while True:
+                key = [[random.randint(0, 25) for _ in range(n)] for _ in range(n)]
+                try: hill_inverse(freeze_key(key))
+                except ValueError: continue
+                return key
+        units = [a for a, x in enumerate(modinv_table(26)) if x is not None]
+        lower = [[1 if i == j else (random.randint(0, 25) if j < i else 0) for j in range(n)] for i in range(n)]
+        upper = [[random.choice(units) if i == j else (random.randint(0, 25) if j > i else 0) for j in range(n)] for i in range(n)]
+        key = matmul_mod(lower, upper)
+        random.shuffle(key)
+        return key
+
+    def format_key(self, key): return ",".join(str(row) for row in key)
+
+class Base64Error(ValueError):
+    """Bad Base64 input. offset is the byte position in the input where it went wrong."""
+    def __init__(self, message, offset):
+        super().__init__(message, offset)  #Both in args so it pickles across worker processes
+        self.offset = offset
+
+    def __str__(self): return f"{self.args[0]} at offset {self.offset}"
+
+_B64_BAD = re.compile(rb"[^A-Za-z0-9+/=\s]")
+_B64_SPACE = b" \t\r\n\v\f"
+
+def _b64_raw_offset(chunk, i):
+    """Position in chunk of its i-th non-whitespace byte."""
+    for j, b in enumerate(chunk):
+        if b not in _B64_SPACE:
+            if i == 0: return j
+            i -= 1
+    return len(chunk)
+
+def b64_encode_stream(chunks, wrap=0):
+    """Yields Base64 for an iterable of bytes-like chunks, 3 input bytes at a time.
+    wrap > 0 breaks the output into lines of that many characters."""
+    def pieces():
+        carry = b""
+        for chunk in chunks:
+            view = memoryview(chunk).cast("B")
+            if carry:
+                take = 3 - len(carry)
+                carry += bytes(view[:take])
+                view = view[take:]
+                if len(carry) < 3: continue
+                yield binascii.b2a_base64(carry, newline=False)
+            cut = len(view) - len(view) % 3
+            if cut: yield binascii.b2a_base64(view[:cut], newline=False)
+            carry = bytes(view[cut:])
+        if carry: yield binascii.b2a_base64(carry, newline=False)
+    return _wrap_lines(pieces(), wrap) if wrap > 0 else pieces()
+
+def _wrap_lines(pieces, wrap):
+    col = 0
+    for piece in pieces:
+        parts = []
+        i = 0
+        while i < len(piece):
+            take = min(wrap - col, len(piece) - i)
+            parts.append(piece[i:i+take])
+            i += take
+            col += take
+            if col == wrap:
+                parts.append(b"\n")
+                col = 0
+        yield b"".join(parts)
+    if col: yield b"\n"
+
+def b64_decode_stream(chunks):
+    """Yields the bytes for an iterable of Base64 chunks, 4 characters at a time.
+    Whitespace is skipped. Raises Base64Error at the first bad character."""
+    carry = b""
+    clean = raw = 0     # non-whitespace characters and bytes before this chunk
+    need = None         # '=' still expected once padding has started
+    for chunk in chunks:
+        chunk = as_bytes(chunk)
+        bad = _B64_BAD.search(chunk)
+        if bad: raise Base64Error(f"Invalid Base64 character {chunk[bad.start():bad.start()+1]!r}", raw + bad.start())
+        data = chunk.translate(None, _B64_SPACE)
+        body, tail = data, b""
+        if need is not None:
+            body, tail = b"", data
+        else:
+            pad = data.find(b"=")
+            if pad >= 0:
+                body, tail = data[:pad], data[pad:]
+                if (clean + pad) % 4 < 2:
+                    raise Base64Error("Misplaced Base64 padding", raw + _b64_raw_offset(chunk, pad))
+                need = 4 - (clean + pad) % 4
+        if tail:
+            k = len(tail) - len(tail.lstrip(b"="))
+            if k > need or k < len(tail):
+                raise Base64Error("Data after Base64 padding", raw + _b64_raw_offset(chunk, len(body) + min(k, need)))
+            need -= k
+        block = carry + body
+        cut = len(block) - len(block) % 4
+        if cut: yield binascii.a2b_base64(block[:cut])
+        carry = block[cut:]
+        clean += len(data)
+        raw += len(chunk)
+    if need:
+        raise Base64Error("Truncated Base64 padding", raw)
+    if need is None and carry:
+        raise Base64Error("Truncated Base64 input", raw)
+    if carry: yield binascii.a2b_base64(carry + b"=" * (4 - len(carry)))
+
+
+class Base64Prepared(PreparedKey):
+    def stream(self, chunks, decrypt=False):
+        if decrypt:
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            for out in b64_decode_stream(c.encode("utf-8") for c in chunks):
+                yield decoder.decode(out)
+            yield decoder.decode(b"", final=True)
+        else:
+            for out in b64_encode_stream(c.encode("utf-8") for c in chunks):
+                yield out.decode("ascii")
 
-    def format_key(self, key): return f"{key[0]},{key[1]}"
 
 class Base64Cipher(Cipher):
     def __init__(self): super().__init__("Base64", "None")
-    def encrypt(self, text, key=None): return base64.b64encode(text.encode('utf-8')).decode('ascii')
+    def _compile(self, key): return Base64Prepared(self, key)
+    def encrypt(self, text, key=None):
+        if isinstance(text, BYTES_TYPES): return binascii.b2a_base64(text, newline=False)
+        return binascii.b2a_base64(text.encode('utf-8'), newline=False).decode('ascii')
     def decrypt(self, text, key=None):
-        try: return base64.b64decode(text.encode('ascii')).decode('utf-8')
-        except: return "[Invalid Base64]"
+        if isinstance(text, BYTES_TYPES): return b"".join(b64_decode_stream([text]))
+        return b"".join(b64_decode_stream([text.encode('utf-8')])).decode('utf-8')
     def generate_key(self): return None
 
-CIPHER_REGISTRY = [
-    Caesar(),
-    ROT13(),
-    Atbash(),
-    Vigenere(),
-    Affine(),
-    Substitution(),
-    RailFence(),
-    Hill(),
-    Base64Cipher()
+def _cipher_slug(name):
+    return re.sub("[^a-z0-9]", "", name.lower())
+
+class CipherRegistry:
+    """The list of ciphers, built as it is used. Each entry is a factory that
+    runs on first access, and plugins are only looked for when a name isn't
+    built in or the whole list is asked for. Plugins come from PLUGIN_GROUP
+    entry points, found by entry point name and only loaded when used, and
+    from .py files in PLUGIN_DIR if that is set. Either may give a Cipher
+    subclass or any zero-argument callable returning a cipher."""
+    def __init__(self, builtins):
+        self.entries = []  #[name, factory, cipher or None]
+        self.plugins_loaded = False
+        for name, factory in builtins: self.add(factory, name)
+
+    def add(self, factory, name=None):
+        base = getattr(factory, "func", factory)  #functools.partial(Hill, 3)
+        self.entries.append([name or getattr(base, "__name__", ""), factory, None])
+
+    def _get(self, entry):
+        if entry[2] is None: entry[2] = entry[1]()
+        return entry[2]
+
+    def _all(self):
+        self.load_plugins()
+        return self.entries
+
+    def __len__(self): return len(self._all())
+    def __iter__(self): return (self._get(e) for e in self._all())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice): return [self._get(e) for e in self._all()[i]]
+        return self._get(self._all()[i])
+
+    def find(self, name):
+        """Returns the cipher called name (or named by its class), or None."""
+        wanted = _cipher_slug(name)
+        while True:
+            for entry in self.entries:
+                base = getattr(entry[1], "func", entry[1])
+                names = [entry[0], base.__name__] if isinstance(base, type) else [entry[0]]
+                if entry[2] is not None: names.append(entry[2].name)
+                if wanted in map(_cipher_slug, names): return self._get(entry)
+            if self.plugins_loaded: return None
+            self.load_plugins()
+
+    def load_plugins(self):
+        if self.plugins_loaded: return
+        self.plugins_loaded = True
+        for ep in _plugin_entry_points():
+            self.add(lambda ep=ep: _as_cipher(ep.load()), ep.name)
+        if PLUGIN_DIR:
+            for factory in _plugin_files(PLUGIN_DIR): self.add(factory)
+
+def _as_cipher(obj):
+    return obj() if callable(obj) else obj
+
+def _plugin_entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return []
+    try:
+        return list(entry_points(group=PLUGIN_GROUP))
+    except TypeError:  #Python < 3.10
+        return list(entry_points().get(PLUGIN_GROUP, []))
+
+def _plugin_files(folder):
+    """Yields cipher factories from each .py file in folder. A file lists them
+    in CIPHERS, or else every Cipher subclass it defines is used."""
+    if not os.path.isdir(folder): return
+    import importlib.util
+    # Plugins import cipher_terminal for Cipher; make that this module even
+    # when it runs as a script.
+    sys.modules.setdefault("cipher_terminal", sys.modules[__name__])
+    for fname in sorted(os.listdir(folder)):
+        if not fname.endswith(".py") or fname.startswith("_"): continue
+        path = os.path.join(folder, fname)
+        spec = importlib.util.spec_from_file_location("cipher_terminal_plugin_" + fname[:-3], path)
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)
+        except Exception as e:
+            print(f"Skipping plugin {path}: {e}", file=sys.stderr)
+            continue
+        found = getattr(module, "CIPHERS", None)
+        if found is None:
+            found = [v for v in vars(module).values() if isinstance(v, type) and issubclass(v, Cipher)
+                     and v.__module__ == module.__name__ and not getattr(v, "__abstractmethods__", None)]
+        yield from found
+
+CIPHER_REGISTRY = CipherRegistry([
+    ("Caesar", Caesar),
+    ("ROT13", ROT13),
+    ("Atbash", Atbash),
+    ("Vigenere", Vigenere),
+    ("Affine", Affine),
+    ("Substitution", Substitution),
+    ("Rail Fence", RailFence),
+    ("Hill (2x2)", Hill),
+    ("Hill (3x3)", partial(Hill, 3)),
+    ("Base64", Base64Cipher)
+])
+
+# ------------------ #
+# Pipelines chain ciphers. Runs of monoalphabetic stages are fused into one
+# translate table, so e.g. Atbash -> Affine -> Caesar is a single pass.
+
+def _fuse_tables(group):
+    domain = set(ALPHABET)
+    for p in group: domain.update(p.enc_map)
+    enc = {}
+    for ch in sorted(domain):
+        out = ch
+        for p in group: out = preserve_nonletters(out).translate(p.enc_table)
+        enc[ch] = out
+    if any(p.dec_table is None for p in group):
+        return TablePrepared(None, None, enc, None)
+    domain = set(ALPHABET)
+    for p in group: domain.update(p.dec_map)
+    dec = {}
+    for ch in sorted(domain):
+        out = ch
+        for p in reversed(group): out = preserve_nonletters(out).translate(p.dec_table)
+        dec[ch] = out
+    return TablePrepared(None, None, enc, dec)
+
+
+class Pipeline:
+    """Ciphers applied one after another: Pipeline([("atbash", None), ("caesar", 3)]).
+    Stages are (cipher or cipher name, key). Decrypting runs them in reverse."""
+    def __init__(self, stages):
+        self.stages = []
+        for cipher, key in stages:
+            if isinstance(cipher, str): cipher = find_cipher(cipher)
+            self.stages.append((cipher, key))
+        self.steps = []
+        group = []
+        for cipher, key in self.stages:
+            prepared = cipher.prepare(key)
+            if isinstance(prepared, TablePrepared):
+                group.append(prepared)
+                continue
+            if group: self.steps.append(group[0] if len(group) == 1 else _fuse_tables(group))
+            group = []
+            self.steps.append(prepared)
+        if group: self.steps.append(group[0] if len(group) == 1 else _fuse_tables(group))
+
+    def __len__(self): return len(self.stages)
+
+    def __repr__(self):
+        return " -> ".join(f"{c.name}({c.format_key(k)})" if k is not None else c.name for c, k in self.stages)
+
+    def encrypt(self, text):
+        for step in self.steps: text = step.encrypt(text)
+        return text
+
+    def decrypt(self, text):
+        for step in reversed(self.steps): text = step.decrypt(text)
+        return text
+
+    def batch(self, texts, decrypt=False):
+        texts = list(texts)
+        for step in (reversed(self.steps) if decrypt else self.steps):
+            texts = step.batch(texts, decrypt)
+        return texts
+
+    def stream(self, chunks, decrypt=False):
+        """Chains the stages' generators, so streamable stages never hold the whole text."""
+        for step in (reversed(self.steps) if decrypt else self.steps):
+            chunks = step.stream(chunks, decrypt)
+        return chunks
+
+# ------------------ #
+# Key search: every key of a small monoalphabetic cipher is scored at once by
+# permuting one 26-bin histogram of the ciphertext, without decrypting anything.
+
+ENGLISH_FREQ = [
+    0.08167, 0.01492, 0.02782, 0.04253, 0.12702, 0.02228, 0.02015, 0.06094, 0.06966,
+    0.00153, 0.00772, 0.04025, 0.02406, 0.06749, 0.07507, 0.01929, 0.00095, 0.05987,
+    0.06327, 0.09056, 0.02758, 0.00978, 0.02360, 0.00150, 0.01974, 0.00074
 ]
 
+_KEY_SEARCH = {}
+
+def letter_counts(text):
+    s = az_letters(text)
+    return [s.count(ch) for ch in ALPHABET]
+
+def chi_squared(counts, freq=ENGLISH_FREQ):
+    n = sum(counts) or 1
+    return sum((c - n * f) ** 2 / (n * f) for c, f in zip(counts, freq))
+
+def _key_search_table(cipher):
+    """(keys, perms) where perms[i][p] is the ciphertext letter for plaintext letter p under keys[i]."""
+    table = _KEY_SEARCH.get(cipher.name)
+    if table is None:
+        keys = cipher.key_space()
+        if keys is None: raise ValueError(f"{cipher.name} keys can't be searched exhaustively")
+        perms = []
+        for key in keys:
+            enc_map = cipher._compile(key).enc_map
+            perms.append([ALPHABET.index(enc_map[ch]) for ch in ALPHABET])
+        table = _KEY_SEARCH[cipher.name] = (keys, perms)
+    return table
+
+def letter_histograms(texts):
+    """26 letter counts per text: one bincount over all texts when numpy is
+    available (rows of an array), else a list of lists."""
+    letters = [az_letters(t) for t in texts]
+    if np and letters:
+        codes = np.frombuffer("".join(letters).encode("ascii"), dtype=np.uint8).astype(np.intp) - 65
+        rows = np.repeat(np.arange(len(letters)), [len(s) for s in letters])
+        return np.bincount(rows * 26 + codes, minlength=26 * len(letters)).reshape(-1, 26)
+    return [[s.count(ch) for ch in ALPHABET] for s in letters]
+
+def crack_batch(cipher, ciphertexts, top=5):
+    """Ranks every key for each ciphertext by chi-squared of its decryption
+    against English. Returns a list of [(key, score), ...], best first."""
+    return rank_keys(cipher, letter_histograms(ciphertexts), top)
+
+def rank_keys(cipher, hists, top=5):
+    """crack_batch on ready-made letter_histograms."""
+    keys, perms = _key_search_table(cipher)
+    if not len(hists): return []
+    if np:
+        # chi-squared expands to sum(h[c]**2 * w[k, c]) / n - 2*total + n with
+        # w[k, perm_k[p]] = 1/f[p], so all keys are one (N, 26) @ (26, K) product.
+        h = np.asarray(hists, dtype=np.float64)
+        perms = np.asarray(perms)
+        w = np.empty(perms.shape)
+        np.put_along_axis(w, perms, 1 / np.asarray(ENGLISH_FREQ), axis=1)
+        total = h.sum(axis=1)
+        n = np.maximum(total, 1)
+        scores = (h * h) @ w.T / n[:, None] + (n - 2 * total)[:, None]
+        order = np.argsort(scores, axis=1, kind="stable")[:, :top]
+        return [[(keys[i], float(row[i])) for i in idx] for row, idx in zip(scores, order)]
+    results = []
+    for h in hists:
+        scored = [(chi_squared([h[c] for c in perm]), i) for i, perm in enumerate(perms)]
+        scored.sort()
+        results.append([(keys[i], score) for score, i in scored[:top]])
+    return results
+
+def crack(cipher, ciphertext, top=5):
+    if cipher.name in SOLVERS: return SOLVERS[cipher.name](ciphertext, top=top)
+    return crack_batch(cipher, [ciphertext], top)[0]
+
+def can_crack(cipher):
+    """Hill of any size can be cracked from known plaintext in crack mode."""
+    return cipher.name in SOLVERS or cipher.key_space() is not None or isinstance(cipher, Hill)
+
+# Vigenere: guess key lengths from index of coincidence and Kasiski spacings,
+# then solve each key column as a Caesar shift. Candidate lengths (or, for a
+# batch, whole ciphertexts) are spread over a process pool.
+
+ENGLISH_IOC = 0.0667
+VIGENERE_MAX_KEY = 20
+KASISKI_SAMPLE = 20000
+POOL_MIN_LETTERS = 2000
+
+def index_of_coincidence(letters):
+    n = len(letters)
+    if n < 2: return 0.0
+    return sum(c * (c - 1) for c in (letters.count(ch) for ch in ALPHABET)) / (n * (n - 1))
+
+def kasiski_votes(letters, max_len=VIGENERE_MAX_KEY, size=3):
+    """votes[L] is how many repeated trigram spacings L divides."""
+    votes = [0] * (max_len + 1)
+    last = {}
+    letters = letters[:KASISKI_SAMPLE]
+    for i in range(len(letters) - size + 1):
+        gram = letters[i:i+size]
+        if gram in last:
+            gap = i - last[gram]
+            for length in range(2, max_len + 1):
+                if gap % length == 0: votes[length] += 1
+        last[gram] = i
+    return votes
+
+def vigenere_key_lengths(letters, max_len=VIGENERE_MAX_KEY, candidates=6):
+    """Most likely key lengths, best first."""
+    max_len = max(1, min(max_len, len(letters) // 2))
+    votes = kasiski_votes(letters, max_len)
+    top_votes = max(votes) or 1
+    scored = []
+    for length in range(1, max_len + 1):
+        ioc = sum(index_of_coincidence(letters[i::length]) for i in range(length)) / length
+        scored.append((abs(ioc - ENGLISH_IOC) - 0.01 * votes[length] / top_votes, length))
+    scored.sort()
+    return [length for _, length in scored[:candidates]]
+
+def _best_shift(column):
+    h = [column.count(ch) for ch in ALPHABET]
+    return min(range(26), key=lambda k: chi_squared([h[(p + k) % 26] for p in range(26)]))
+
+def _vigenere_try_length(letters, length):
+    """Solves every column for one key length. Returns (score, key)."""
+    v = Vigenere()
+    key = "".join(ALPHABET[_best_shift(letters[i::length])] for i in range(length))
+    # A multiple of the true length always fits a little better, since each
+    # column is shorter. If most of the key repeats a divisor's key and that
+    # key decrypts nearly as well, use it.
+    score = chi_squared(letter_counts(v.decrypt(letters, key)))
+    for size in range(1, length):
+        if length % size: continue
+        short = "".join(ALPHABET[_best_shift(letters[i::size])] for i in range(size))
+        if sum(a == b for a, b in zip(key, v._keystream(short, length))) * 2 <= length: continue
+        short_score = chi_squared(letter_counts(v.decrypt(letters, short)))
+        if short_score <= 2 * score: return short_score, short
+    return score, key
+
+def _vigenere_solve_inline(letters, max_len, candidates):
+    results = {}
+    for length in vigenere_key_lengths(letters, max_len, candidates):
+        score, key = _vigenere_try_length(letters, length)
+        results.setdefault(key, score)
+    return sorted(results.items(), key=lambda r: r[1])
+
+def solve_vigenere(ciphertext, top=5, max_len=VIGENERE_MAX_KEY, candidates=6, workers=None, budget=None):
+    """Recovers likely Vigenere keys. Returns [(key, score), ...], best first.
+    workers=1 runs in this process; budget is a time limit in seconds, after
+    which only the key lengths already finished are ranked."""
+    letters = az_letters(ciphertext)
+    if not letters: return []
+    lengths = vigenere_key_lengths(letters, max_len, candidates)
+    if workers == 1 or len(letters) < POOL_MIN_LETTERS:
+        deadline = None if budget is None else time.perf_counter() + budget
+        pairs = []
+        for length in lengths:
+            if deadline is not None and time.perf_counter() >= deadline: break
+            pairs.append(_vigenere_try_length(letters, length))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, wait
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(_vigenere_try_length, letters, length) for length in lengths]
+            done, _ = wait(futures, timeout=budget)
+            pairs = [f.result() for f in futures if f in done]
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    results = {}
+    for score, key in pairs:
+        results.setdefault(key, score)
+    return sorted(results.items(), key=lambda r: r[1])[:top]
+
+def solve_vigenere_batch(ciphertexts, top=5, max_len=VIGENERE_MAX_KEY, candidates=6, workers=None, budget=None):
+    """solve_vigenere for many intercepts, one per pool task. Intercepts not
+    finished within budget seconds get an empty result."""
+    texts = [az_letters(t) for t in ciphertexts]
+    if workers == 1:
+        deadline = None if budget is None else time.perf_counter() + budget
+        out = []
+        for t in texts:
+            if not t or (deadline is not None and time.perf_counter() >= deadline): out.append([])
+            else: out.append(_vigenere_solve_inline(t, max_len, candidates)[:top])
+        return out
+    from concurrent.futures import ProcessPoolExecutor, wait
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(_vigenere_solve_inline, t, max_len, candidates) for t in texts]
+        done, _ = wait(futures, timeout=budget)
+        return [f.result()[:top] if f in done else [] for f in futures]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Substitution: anneal over keys scored by quadgram log-probabilities.
+# Swapping two letters only changes the quadgrams that contain them, so each
+# step rescores those positions instead of the whole text. Restarts run in
+# parallel processes.
+
+SUBSTITUTION_RESTARTS = 8
+SUBSTITUTION_STEPS = 10000
+SUBSTITUTION_TEMP = 4.0
+_QUADGRAMS = None
+
+def _quadgram_corpus():
+    """English text to count quadgrams from when there's no QUADGRAM_FILE:
+    the phrase library, the dictionary and Python's own help topics."""
+    parts = list(PhraseManager.INTERNAL_LIBRARY)
+    if os.path.exists(DICT_FILE):
+        with open(DICT_FILE, "r", encoding="utf-8") as f:
+            parts.append(f.read())
+    try:
+        from pydoc_data.topics import topics
+        parts.extend(topics.values())
+    except ImportError:
+        pass
+    return az_letters(" ".join(parts))
+
+def load_quadgrams(path=QUADGRAM_FILE):
+    """Flat 26**4 array of log10 quadgram probabilities, index ((a*26+b)*26+c)*26+d."""
+    global _QUADGRAMS
+    if _QUADGRAMS is not None: return _QUADGRAMS
+    counts = array('d', bytes(8 * 26**4))
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and len(parts[0]) == 4 and parts[0].isalpha():
+                    a, b, c, d = (ALPHABET.index(ch) for ch in parts[0].upper())
+                    counts[((a*26 + b)*26 + c)*26 + d] += float(parts[1])
+    else:
+        v = [ALPHABET.index(ch) for ch in _quadgram_corpus()]
+        for i in range(len(v) - 3):
+            counts[((v[i]*26 + v[i+1])*26 + v[i+2])*26 + v[i+3]] += 1
+    total = sum(counts) or 1.0
+    floor = log10(0.01 / total)
+    for i, c in enumerate(counts):
+        counts[i] = log10(c / total) if c else floor
+    _QUADGRAMS = counts
+    return counts
+
+def quadgram_score(text):
+    q = load_quadgrams()
+    v = [ALPHABET.index(ch) for ch in az_letters(text)]
+    return sum(q[((v[i]*26 + v[i+1])*26 + v[i+2])*26 + v[i+3]] for i in range(len(v) - 3))
+
+def _substitution_climb(cipher_ints, seed, steps=SUBSTITUTION_STEPS, deadline=None):
+    """One annealing restart. Returns (score, dec) where dec[cipher letter] = plain letter.
+    deadline is a time.time() at which the best key so far is returned."""
+    q = load_quadgrams()
+    rng = random.Random(seed)
+    n = len(cipher_ints)
+    if seed == 0:
+        # First restart starts from the frequency-order guess.
+        by_freq = sorted(range(26), key=lambda x: -cipher_ints.count(x))
+        english = sorted(range(26), key=lambda p: -ENGLISH_FREQ[p])
+        dec = [0] * 26
+        for x, p in zip(by_freq, english): dec[x] = p
+    else:
+        dec = list(range(26))
+        rng.shuffle(dec)
+
+    where = [[] for _ in range(26)]
+    for i, x in enumerate(cipher_ints): where[x].append(i)
+    touched = [sorted({j for i in where[x] for j in range(i - 3, i + 1) if 0 <= j <= n - 4}) for x in range(26)]
+    present = [x for x in range(26) if where[x]]
+
+    p = [dec[x] for x in cipher_ints]
+    qs = [q[((p[j]*26 + p[j+1])*26 + p[j+2])*26 + p[j+3]] for j in range(n - 3)]
+    score = sum(qs)
+
+    # Simulated annealing: worse swaps are sometimes kept while the
+    # temperature is high, which gets the climb out of local maxima.
+    best, best_dec = score, list(dec)
+    union = {}
+    for step in range(steps):
+        if deadline is not None and not step % 256 and time.time() >= deadline: break
+        temp = SUBSTITUTION_TEMP * (1 - step / steps)
+        x = rng.choice(present)
+        y = rng.randrange(25)
+        if y >= x: y += 1
+        px, py = dec[x], dec[y]
+        for i in where[x]: p[i] = py
+        for i in where[y]: p[i] = px
+        affected = union.get((x, y))
+        if affected is None:
+            affected = union[x, y] = union[y, x] = sorted(set(touched[x]).union(touched[y]))
+        new = [q[((p[j]*26 + p[j+1])*26 + p[j+2])*26 + p[j+3]] for j in affected]
+        delta = sum(new) - sum(qs[j] for j in affected)
+        if delta > 0 or (temp > 0 and rng.random() < exp(delta / temp)):
+            dec[x], dec[y] = py, px
+            for j, v in zip(affected, new): qs[j] = v
+            score += delta
+            if score > best: best, best_dec = score, list(dec)
+        else:
+            for i in where[x]: p[i] = px
+            for i in where[y]: p[i] = py
+    return best, best_dec
+
+def solve_substitution(ciphertext, top=5, restarts=SUBSTITUTION_RESTARTS, workers=None, budget=None):
+    """Recovers likely Substitution keymaps. Returns [(keymap, score), ...], best first.
+    Higher scores are better here (quadgram log-probability)."""
+    cipher_ints = [ALPHABET.index(ch) for ch in az_letters(ciphertext)]
+    if len(cipher_ints) < 4: return []
+    deadline = None if budget is None else time.time() + budget
+    load_quadgrams()
+    if workers == 1 or restarts == 1:
+        runs = []
+        for seed in range(restarts):
+            if runs and deadline is not None and time.time() >= deadline: break
+            runs.append(_substitution_climb(cipher_ints, seed, deadline=deadline))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, wait
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(_substitution_climb, cipher_ints, seed, deadline=deadline)
+                       for seed in range(restarts)]
+            done, _ = wait(futures, timeout=budget)
+            runs = [f.result() for f in futures if f in done]
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    results, seen = [], set()
+    for score, dec in sorted(runs, key=lambda r: -r[0]):
+        if tuple(dec) in seen: continue
+        seen.add(tuple(dec))
+        results.append(({ALPHABET[dec[x]]: ALPHABET[x] for x in range(26)}, score))
+    return results[:top]
+
+# Hill: ciphertext blocks are K times plaintext blocks, so n known blocks
+# whose plaintext matrix P is invertible mod 26 give K = C * P^-1 (mod 26).
+# When no set of blocks is invertible, the key rows are solved mod 2 and
+# mod 13 on their own and every solution is tried, as long as there are few.
+
+HILL_CRIB_SETS = 10       #Sets of n blocks tried per crib offset
+HILL_MAX_KEYS = 64        #Most keys enumerated for under-determined known plaintext
+HILL_SWEEP_ROWS = 12      #Best decryption rows paired up in the 2x2 sweep
+
+def _usable_blocks(pv):
+    """Indexes of blocks that can be part of an invertible matrix: not all
+    even and not all multiples of 13."""
+    return [i for i, p in enumerate(pv) if any(x % 2 for x in p) and any(x % 13 for x in p)]
+
+def _hill_fits(key, pv, cv):
+    return all([sum(k * x for k, x in zip(row, p)) % 26 for row in key] == c for p, c in zip(pv, cv))
+
+def _solve_mod_prime(rows, rhs_cols, p):
+    """Solves rows . x = rhs (mod prime p) for several right-hand sides at once.
+    Returns ([one solution per rhs], nullspace basis), or None if inconsistent."""
+    n = len(rows[0])
+    inv = modinv_table(p)
+    m = [[x % p for x in row] + [col[i] % p for col in rhs_cols] for i, row in enumerate(rows)]
+    pivots = []
+    for c in range(n):
+        r = len(pivots)
+        pivot = next((i for i in range(r, len(m)) if m[i][c]), None)
+        if pivot is None: continue
+        m[r], m[pivot] = m[pivot], m[r]
+        f = inv[m[r][c]]
+        m[r] = [x * f % p for x in m[r]]
+        for i in range(len(m)):
+            g = m[i][c]
+            if i != r and g:
+                m[i] = [(x - g * y) % p for x, y in zip(m[i], m[r])]
+        pivots.append(c)
+    if any(any(row[n:]) for row in m[len(pivots):]): return None
+    solutions = []
+    for j in range(len(rhs_cols)):
+        x = [0] * n
+        for i, c in enumerate(pivots): x[c] = m[i][n + j]
+        solutions.append(x)
+    basis = []
+    for f in (c for c in range(n) if c not in pivots):
+        v = [0] * n
+        v[f] = 1
+        for i, c in enumerate(pivots): v[c] = -m[i][f] % p
+        basis.append(v)
+    return solutions, basis
+
+def _keys_mod_prime(pv, cv, n, p, limit):
+    solved = _solve_mod_prime(pv, [[c[r] for c in cv] for r in range(n)], p)
+    if solved is None: return []
+    rows, basis = solved
+    if p ** (len(basis) * n) > limit: return None
+    options = []
+    for row in rows:
+        choices = []
+        for ts in product(range(p), repeat=len(basis)):
+            choices.append([(x + sum(t * v[i] for t, v in zip(ts, basis))) % p for i, x in enumerate(row)])
+        options.append(choices)
+    return [list(key) for key in product(*options)]
+
+def hill_keys_from_blocks(pv, cv, n, limit=HILL_MAX_KEYS):
+    """Every invertible key that maps plaintext blocks pv to ciphertext blocks
+    cv (lists of n numbers). None if more than limit keys would fit."""
+    mod2 = _keys_mod_prime(pv, cv, n, 2, limit)
+    mod13 = _keys_mod_prime(pv, cv, n, 13, limit)
+    if mod2 is None or mod13 is None or len(mod2) * len(mod13) > limit: return None
+    keys = []
+    for a in mod2:
+        for b in mod13:
+            key = [[(13 * x + 14 * y) % 26 for x, y in zip(ra, rb)] for ra, rb in zip(a, b)]
+            try:
+                hill_inverse(freeze_key(key))
+            except ValueError:
+                continue
+            keys.append(key)
+    return keys
+
+def hill_keys_from_pairs(plaintext, ciphertext, n=2):
+    """Every n x n key that turns the known plaintext into the ciphertext, both
+    starting on a block boundary. One key unless the plaintext is too short or
+    too regular to pin it down."""
+    p, c = az_letters(plaintext), az_letters(ciphertext)
+    blocks = min(len(p), len(c)) // n
+    if blocks < n: raise ValueError(f"Need at least {n * n} letters of known plaintext")
+    pv = [[ord(ch) - 65 for ch in p[i*n:(i+1)*n]] for i in range(blocks)]
+    cv = [[ord(ch) - 65 for ch in c[i*n:(i+1)*n]] for i in range(blocks)]
+    keys = hill_keys_from_blocks(pv, cv, n)
+    if keys is None: raise ValueError("Too many keys fit; more known plaintext is needed")
+    return keys
+
+def _solve_hill_batch(P, C):
+    """K = C * P^-1 mod 26 for a batch of n x n matrix pairs (columns are
+    blocks). None where P or K isn't invertible."""
+    if not np:
+        keys = []
+        for p, c in zip(P, C):
+            try:
+                key = matmul_mod(c, hill_inverse(freeze_key(p)))
+                hill_inverse(freeze_key(key))
+                keys.append(key)
+            except ValueError:
+                keys.append(None)
+        return keys
+    P = np.asarray(P, dtype=np.int64)
+    C = np.asarray(C, dtype=np.int64)
+    inv26 = np.asarray([x or 0 for x in modinv_table(26)], dtype=np.int64)
+    # Integer det and adjugate through floating point; exact for small n.
+    det = np.rint(np.linalg.det(P)).astype(np.int64) % 26
+    ok = np.gcd(det, 26) == 1
+    keys = [None] * len(P)
+    if not ok.any(): return keys
+    Pk = P[ok].astype(np.float64)
+    adj = np.rint(np.linalg.inv(Pk) * np.linalg.det(Pk)[:, None, None]).astype(np.int64) % 26
+    K = (C[ok] @ (adj * inv26[det[ok]][:, None, None] % 26)) % 26
+    k_det = np.rint(np.linalg.det(K.astype(np.float64))).astype(np.int64) % 26
+    for i, key, d in zip(np.flatnonzero(ok), K, k_det):
+        if np.gcd(d, 26) == 1: keys[i] = key.tolist()
+    return keys
+
+def hill_crib_attack(ciphertext, crib, n=2, top=5):
+    """Tries a known plaintext fragment at every offset. Each offset gives a
+    few block sets, which are solved together in one batch; keys that fit the
+    whole crib are ranked by quadgram score. Returns [(key, score)]."""
+    c, crib = az_letters(ciphertext), az_letters(crib)
+    cv = [ord(ch) - 65 for ch in c]
+    pv = [ord(ch) - 65 for ch in crib]
+    jobs, P, C = [], [], []
+    for o in range(len(c) - len(crib) + 1):
+        first = -(-o // n) * n
+        blocks = (o + len(crib) - first) // n
+        usable = _usable_blocks([pv[first - o + b*n:first - o + (b+1)*n] for b in range(blocks)])
+        for combo in islice(combinations(usable, n), HILL_CRIB_SETS):
+            P.append([[pv[first - o + b*n + r] for b in combo] for r in range(n)])
+            C.append([[cv[first + b*n + r] for b in combo] for r in range(n)])
+            jobs.append((o, first, blocks))
+    found = {}
+    for (o, first, blocks), key in zip(jobs, _solve_hill_batch(P, C) if jobs else []):
+        if key is None: continue
+        crib_p = [pv[first - o + b*n:first - o + (b+1)*n] for b in range(blocks)]
+        crib_c = [cv[first + b*n:first + (b+1)*n] for b in range(blocks)]
+        if _hill_fits(key, crib_p, crib_c): found.setdefault(o, []).append(key)
+    # Offsets where no block set was invertible get the exact solver.
+    for o in range(len(c) - len(crib) + 1):
+        first = -(-o // n) * n
+        blocks = (o + len(crib) - first) // n
+        if o in found or blocks < 1: continue
+        crib_p = [pv[first - o + b*n:first - o + (b+1)*n] for b in range(blocks)]
+        crib_c = [cv[first + b*n:first + (b+1)*n] for b in range(blocks)]
+        found[o] = hill_keys_from_blocks(crib_p, crib_c, n) or []
+    hill, seen, results = Hill(n), set(), []
+    for keys in found.values():
+        for key in keys:
+            if freeze_key(key) in seen: continue
+            seen.add(freeze_key(key))
+            results.append((key, quadgram_score(hill.decrypt(c, key))))
+    results.sort(key=lambda r: -r[1])
+    return results[:top]
+
+def solve_hill2(ciphertext, top=5, keep=HILL_SWEEP_ROWS):
+    """2x2 without a crib. Each row of the decryption matrix gives every other
+    plaintext letter on its own, so the 676 possible rows are scored
+    separately (chi-squared against English) instead of all 26**4 matrices.
+    Rows that can't be in an invertible matrix are rejected first, only the
+    best keep rows are paired, and the pairs are ranked by quadgram score."""
+    c = az_letters(ciphertext)
+    c = c[:len(c) - len(c) % 2]
+    if len(c) < 4: return []
+    x = [ord(ch) - 65 for ch in c[0::2]]
+    y = [ord(ch) - 65 for ch in c[1::2]]
+    rows = [(a, b) for a in range(26) for b in range(26) if gcd(gcd(a, b), 26) == 1]
+    if np:
+        r = np.asarray(rows, dtype=np.int64)
+        letters = (r[:, :1] * np.asarray(x) + r[:, 1:] * np.asarray(y)) % 26
+        counts = np.bincount((letters + 26 * np.arange(len(rows))[:, None]).ravel(),
+                             minlength=26 * len(rows)).reshape(-1, 26)
+        expected = len(x) * np.asarray(ENGLISH_FREQ)
+        chi = (((counts - expected) ** 2) / expected).sum(axis=1).tolist()
+    else:
+        chi = []
+        for a, b in rows:
+            counts = [0] * 26
+            for u, v in zip(x, y): counts[(a * u + b * v) % 26] += 1
+            chi.append(chi_squared(counts))
+    best = [rows[i] for i in sorted(range(len(rows)), key=chi.__getitem__)[:keep]]
+    hill = Hill(2)
+    results = []
+    for r0 in best:
+        for r1 in best:
+            if gcd((r0[0] * r1[1] - r0[1] * r1[0]) % 26, 26) != 1: continue
+            key = [list(row) for row in hill_inverse((r0, r1))]
+            results.append((key, quadgram_score(hill.decrypt(c, key))))
+    results.sort(key=lambda r: -r[1])
+    return results[:top]
+
+SOLVERS = {
+    "Vigenere": solve_vigenere,
+    "Substitution": solve_substitution,
+    "Hill (2x2)": solve_hill2,
+}
+
+# ------------------ #
+# English detector: "does this candidate read as English?" Words come from
+# COMMON_WORDS, the phrase library, the dictionary and any wordlists. A
+# bounded trie of them segments text with the spaces removed (Rail Fence,
+# Hill); a Bloom filter holds the rest of a big wordlist for spaced text.
+
+COMMON_WORDS = """
+THE BE TO OF AND IN THAT HAVE IT FOR NOT ON WITH HE AS YOU DO AT THIS BUT HIS BY FROM THEY WE SAY HER SHE
+OR AN WILL MY ONE ALL WOULD THERE THEIR WHAT SO UP OUT IF ABOUT WHO GET WHICH GO ME WHEN MAKE CAN LIKE TIME
+NO JUST HIM KNOW TAKE PEOPLE INTO YEAR YOUR GOOD SOME COULD THEM SEE OTHER THAN THEN NOW LOOK ONLY COME ITS
+OVER THINK ALSO BACK AFTER USE TWO HOW OUR WORK FIRST WELL WAY EVEN NEW WANT BECAUSE ANY THESE GIVE DAY MOST
+US IS ARE WAS WERE BEEN HAS HAD DID DOES SAID MADE MUST MAY SHALL SHOULD MANY MUCH MORE VERY HERE WHERE WHY
+THOSE EACH EVERY ANOTHER SUCH OWN SAME PART PLACE THING THINGS WORLD LIFE HAND HOME HOUSE NIGHT MAN MEN WOMAN
+CHILD LITTLE GREAT OLD LONG HIGH SMALL LARGE RIGHT LEFT NEXT LAST FEW BEST NEVER ALWAYS AGAIN STILL BETWEEN
+UNDER THROUGH WHILE BEFORE DOWN OFF AWAY AROUND WITHOUT AGAINST ATTACK DAWN AT NOON MEET SECRET MESSAGE KEY
+CODE CIPHER SEND FIND FOUND TELL TOLD ASK FEEL LEAVE CALL KEEP LET BEGIN SEEM HELP SHOW HEAR PLAY RUN MOVE
+LIVE BELIEVE BRING HAPPEN WRITE SIT STAND LOSE PAY MEAN READ SPEAK WORD WORDS WATER FIRE LIGHT HEART MIND
+POWER MONEY WAR PEACE LOVE TRUTH FRIEND ENEMY NAME CITY NORTH SOUTH EAST WEST BOOK STORY QUESTION ANSWER
+""".split()
+
+TRIE_MAX_WORDS = 50_000       #Words kept in the segmenting trie; the rest only go in the Bloom filter
+BLOOM_ERROR_RATE = 0.01
+BLOOM_MAX_BITS = 1 << 26      #8 MB cap whatever the wordlist size
+ENGLISH_PREFILTER_CHI2 = 200.0
+_WORD_END = ""
+
+class BloomFilter:
+    """Fixed-size set membership with false positives, for big wordlists."""
+    def __init__(self, expected, error_rate=BLOOM_ERROR_RATE, max_bits=BLOOM_MAX_BITS):
+        expected = max(expected, 1)
+        self.bits = min(max_bits, max(64, int(-expected * log(error_rate) / (log(2) ** 2))))
+        self.hashes = max(1, round(self.bits / expected * log(2)))
+        self.table = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, word):
+        data = word.encode("ascii", "ignore")
+        h1 = zlib.crc32(data)
+        h2 = zlib.adler32(data) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, word):
+        for p in self._positions(word): self.table[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, word):
+        t = self.table
+        return all(t[p >> 3] >> (p & 7) & 1 for p in self._positions(word))
+
+
+class EnglishDetector:
+    """Scores text by the fraction of its letters covered by known words
+    (two or more letters), 0.0 to 1.0. English is usually above 0.8."""
+    def __init__(self, wordlists=()):
+        self.trie = {}
+        self.words = set()
+        self.max_len = 0
+        self.bloom = None
+        for word in COMMON_WORDS: self._add(word)
+        for line in PhraseManager.INTERNAL_LIBRARY: self._add_text(line)
+        if os.path.exists(DICT_FILE):
+            with open(DICT_FILE, "r", encoding="utf-8") as f:
+                for line in f: self._add_text(line)
+        for path in wordlists:
+            self._load_wordlist(path)
+
+    def _add(self, word):
+        if len(word) < 2 or word in self.words: return
+        self.words.add(word)
+        self.max_len = max(self.max_len, len(word))
+        node = self.trie
+        for ch in word: node = node.setdefault(ch, {})
+        node[_WORD_END] = True
+
+    def _add_text(self, text):
+        for word in preserve_nonletters(text).split(): self._add(az_letters(word))
+
+    def _load_wordlist(self, path):
+        # Size the filter from the file size (7 bytes a word errs on the big side) so the
+        # list is only read once.
+        if self.bloom is None:
+            self.bloom = BloomFilter(os.path.getsize(path) // 7 + 1)
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                word = az_letters(line)
+                if len(word) < 2: continue
+                if len(self.words) < TRIE_MAX_WORDS: self._add(word)
+                else: self.bloom.add(word)
+
+    def __contains__(self, word):
+        return word in self.words or (self.bloom is not None and word in self.bloom)
+
+    def plausible(self, letters):
+        """Cheap prefilter on letter frequencies; rejects most wrong keys of a
+        substitution-type cipher before any segmenting."""
+        if len(letters) < 20: return True
+        return chi_squared([letters.count(ch) for ch in ALPHABET]) < ENGLISH_PREFILTER_CHI2
+
+    def score(self, text, floor=0.0):
+        """Covered-letter fraction. Gives up and returns 0.0 as soon as the
+        result can't reach floor."""
+        seq = preserve_nonletters(text)
+        letters = az_letters(seq)
+        n = len(letters)
+        if not n or not self.plausible(letters): return 0.0
+        allowed = n - floor * n
+        words = seq.split()
+        if len(words) > 1 and n / len(words) < self.max_len:
+            # Spaced text: look each word up.
+            missed = 0
+            for word in words:
+                word = az_letters(word)
+                if word and word not in self:
+                    missed += len(word)
+                    if missed > allowed: return 0.0
+            return 1.0 - missed / n
+        return self.segment_score(letters, allowed)
+
+    def segment_score(self, letters, allowed=None):
+        """Best covered-letter fraction over every way of cutting letters into
+        trie words, by dynamic programming left to right."""
+        n = len(letters)
+        if allowed is None: allowed = n
+        trie, end, max_len = self.trie, _WORD_END, self.max_len
+        best = [-1] * (n + 1)
+        best[0] = 0
+        for i in range(n):
+            b = best[i]
+            if b < 0: continue
+            # i - best[i] letters are already uncovered on the best path to i.
+            if i - b > allowed: return 0.0
+            if best[i+1] < b: best[i+1] = b
+            node = trie
+            for j in range(i, min(n, i + max_len)):
+                node = node.get(letters[j])
+                if node is None: break
+                if end in node and best[j+1] < b + j + 1 - i:
+                    best[j+1] = b + j + 1 - i
+        if n - best[n] > allowed: return 0.0
+        return best[n] / n
+
+    def segment(self, letters):
+        """Splits de-spaced letters into the words that cover the most of them."""
+        n = len(letters)
+        best = [(-1, 0)] * (n + 1)
+        best[0] = (0, 0)
+        for i in range(n):
+            b = best[i][0]
+            if b < 0: continue
+            if best[i+1][0] < b: best[i+1] = (b, i)
+            node = self.trie
+            for j in range(i, min(n, i + self.max_len)):
+                node = node.get(letters[j])
+                if node is None: break
+                if _WORD_END in node and best[j+1][0] < b + j + 1 - i:
+                    best[j+1] = (b + j + 1 - i, i)
+        parts, j = [], n
+        while j > 0:
+            i = best[j][1]
+            parts.append(letters[i:j])
+            j = i
+        # Unmatched letters come out one at a time; join runs of them back up.
+        words, run = [], ""
+        for part in reversed(parts):
+            if len(part) == 1:
+                run += part
+                continue
+            if run: words.append(run)
+            run = ""
+            words.append(part)
+        if run: words.append(run)
+        return " ".join(words)
+
+    def rank(self, candidates, top=5):
+        """[(score, candidate)] for the best top candidates. The worst score
+        still in the running is passed on as the floor, so most losers exit early."""
+        import heapq
+        heap = []
+        for i, text in enumerate(candidates):
+            floor = heap[0][0] if len(heap) >= top else 0.0
+            sc = self.score(text, floor)
+            if len(heap) < top: heapq.heappush(heap, (sc, -i, text))
+            elif sc > heap[0][0]: heapq.heapreplace(heap, (sc, -i, text))
+        return [(sc, text) for sc, _, text in sorted(heap, reverse=True)]
+
+_english = None
+
+def english_detector():
+    """Shared EnglishDetector, built on first use with WORDLIST_FILE if present."""
+    global _english
+    if _english is None:
+        _english = EnglishDetector([WORDLIST_FILE] if os.path.exists(WORDLIST_FILE) else [])
+    return _english
+
+def english_score(text, floor=0.0):
+    return english_detector().score(text, floor)
+
+# ------------------ #
+# Cipher identification: guesses which registry cipher made a ciphertext
+# from cheap features, all computed over the whole batch at once:
+#   - Base64 alphabet and padding
+#   - whether non-letters survived (Rail Fence and Hill drop them)
+#   - length divisible by 2 or 3 (Hill blocks)
+#   - index of coincidence: English-like for monoalphabetic and
+#     transposition ciphers, flatter for Vigenere and Hill
+#   - chi-squared of the letters as they are: low for Rail Fence, which only
+#     moves letters around
+#   - best chi-squared over every Caesar/ROT13/Atbash/Affine key (rank_keys)
+#   - repeated letter pairs at even versus odd offsets: Hill 2x2 enciphers
+#     aligned pairs, so those repeat more
+# Each cipher gets a log-score; softmax turns them into confidences.
+
+_B64_TEXT = re.compile(r"[A-Za-z0-9+/\s]+={0,2}\s*")
+IDENTIFY_TEMPERATURE = 1.0
+
+def _is_base64_text(text):
+    compact = "".join(text.split())
+    if len(compact) < 4 or len(compact) % 4 or not _B64_TEXT.fullmatch(text): return False
+    # Letters-only text can be valid Base64 by accident; wanting a digit,
+    # '+', '/', '=' or mixed case keeps uppercase cipher output out.
+    return not compact.isalpha() or not (compact.isupper() or compact.islower())
+
+def _pair_evidence(letters):
+    """> 0 when pairs starting at even offsets repeat more than at odd ones."""
+    def repeats(pairs): return len(pairs) - len(set(pairs))
+    even = repeats([letters[j:j+2] for j in range(0, len(letters) - 1, 2)])
+    odd = repeats([letters[j:j+2] for j in range(1, len(letters) - 1, 2)])
+    return (even - odd) / (even + odd + 1) ** 0.5
+
+def _fit(chi, n):
+    """Log-score from a chi-squared: around 0 for English-like, very negative for not."""
+    return -chi / (26 + 0.05 * n)
+
+def identify_batch(ciphertexts, top=3):
+    """For each ciphertext, [(cipher name, confidence), ...] best first; confidences sum
+    to 1 over every cipher. Empty for text with no letters that isn't Base64."""
+    texts = list(ciphertexts)
+    if not texts: return []
+    hists = letter_histograms(texts)
+    mono = {}
+    for name in ("Caesar", "ROT13", "Atbash", "Affine"):
+        mono[name] = [r[0][1] if r else 0.0 for r in rank_keys(find_cipher(name), hists, 1)]
+    if np:
+        h = np.asarray(hists, dtype=np.float64)
+        n = h.sum(axis=1)
+        ioc = ((h * (h - 1)).sum(axis=1) / np.maximum(n * (n - 1), 1)).tolist()
+        expected = np.maximum(n, 1)[:, None] * np.asarray(ENGLISH_FREQ)
+        plain = (((h - expected) ** 2) / expected).sum(axis=1).tolist()
+        n = n.astype(int).tolist()
+    else:
+        n = [sum(row) for row in hists]
+        ioc = [sum(c * (c - 1) for c in row) / max(k * (k - 1), 1) for row, k in zip(hists, n)]
+        plain = [chi_squared(row) for row in hists]
+
+    results = []
+    for i, text in enumerate(texts):
+        k = n[i]
+        if _is_base64_text(text):
+            logits = {"Base64": 10.0}
+        elif not k:
+            results.append([])
+            continue
+        else:
+            logits = {}
+            letters_only = k > 0 and k == len(text.strip())
+            spaced = k > 0 and not letters_only
+            # Monoalphabetic: Affine covers the other three, so they get a small
+            # edge when their one key explains the text as well.
+            best_mono = min(mono[name][i] for name in mono)
+            # All of these keep spaces and punctuation.
+            kept = 0.0 if spaced else -2.0
+            for name, bonus in (("ROT13", 1.3), ("Atbash", 1.3), ("Caesar", 1.2), ("Affine", 1.0)):
+                logits[name] = _fit(mono[name][i], k) + bonus + kept
+            flat = abs(ioc[i] - ENGLISH_IOC) / 0.008
+            # Substitution is what's left when no single small key explains it.
+            logits["Substitution"] = -flat * flat - max(0.0, 3.0 + _fit(best_mono, k)) + kept
+            logits["Vigenere"] = -((ioc[i] - 0.045) / 0.01) ** 2 + (0.5 if spaced else -1.0)
+            logits["Rail Fence"] = _fit(plain[i], k) + (0.5 if letters_only else -4.0)
+            hill = -((ioc[i] - 0.045) / 0.008) ** 2 + (0.5 if letters_only else -4.0)
+            pairs = 0.7 * _pair_evidence(az_letters(text)) if letters_only else 0.0
+            logits["Hill (2x2)"] = hill + pairs + (0.0 if k % 2 == 0 else -6.0)
+            logits["Hill (3x3)"] = hill - pairs + (0.0 if k % 3 == 0 else -6.0)
+            logits["Base64"] = -8.0
+        results.append(_softmax_ranking(logits, top))
+    return results
+
+def _softmax_ranking(logits, top):
+    m = max(logits.values())
+    weights = {name: exp((v - m) / IDENTIFY_TEMPERATURE) for name, v in logits.items()}
+    total = sum(weights.values())
+    ranked = sorted(weights.items(), key=lambda kv: -kv[1])[:top]
+    return [(name, w / total) for name, w in ranked]
+
+def identify(ciphertext, top=3):
+    return identify_batch([ciphertext], top)[0]
+
 # ------------------ #
 
 def ensure_user(stats, user):
@@ -442,10 +2335,10 @@ def ensure_cipher_entry(stats, user, cipher_name):
     ensure_user(stats, user)
     if cipher_name not in stats[user]["ciphers"]:
         stats[user]["ciphers"][cipher_name] = {
-            "attempts": 0, "correct": 0, "hints": 0, "fastest": None, "longest": None
+            "attempts": 0, "correct": 0, "hints": 0, "fastest": None, "longest": None, "hint_free": 0
         }
 
-def record_attempt(stats, user, cipher_name, correct, hints_used, elapsed_seconds):
+def apply_attempt(stats, user, cipher_name, correct, hints_used, elapsed_seconds):
     ensure_cipher_entry(stats, user, cipher_name)
     stats[user]["total_attempts"] += 1
     stats[user]["total_hints"] += hints_used
@@ -455,13 +2348,490 @@ def record_attempt(stats, user, cipher_name, correct, hints_used, elapsed_second
     c["attempts"] += 1
     c["hints"] += hints_used
     if correct: c["correct"] += 1
+    if correct and not hints_used: c["hint_free"] = c.get("hint_free", 0) + 1
 
     if elapsed_seconds is not None and correct:
         if c["fastest"] is None or elapsed_seconds < c["fastest"]:
             c["fastest"] = elapsed_seconds
         if c["longest"] is None or elapsed_seconds > c["longest"]:
             c["longest"] = elapsed_seconds
-    save_stats(stats)
+
+def record_attempt(stats, user, cipher_name, correct, hints_used, elapsed_seconds):
+    apply_attempt(stats, user, cipher_name, correct, hints_used, elapsed_seconds)
+    if _leaderboard is not None:
+        _leaderboard.update(user, cipher_name, stats[user]["ciphers"][cipher_name])
+    get_stats_store().record(stats, user, cipher_name, correct, hints_used, elapsed_seconds)
+    get_attempt_log().append(user, cipher_name, correct, hints_used, elapsed_seconds)
+
+# ------------------ #
+# Attempt log: every attempt as one row of six fixed-width columns, each in
+# its own append-only file, plus users.names and ciphers.names listing the
+# names behind the ids, one JSON string per line. Columns are read with numpy.memmap (or array when numpy is
+# missing), so percentiles and trends never build per-attempt Python objects.
+
+ATTEMPT_COLUMNS = (  # name, array typecode, numpy dtype
+    ("user", "I", "uint32"),
+    ("cipher", "H", "uint16"),
+    ("correct", "B", "uint8"),
+    ("hints", "H", "uint16"),
+    ("elapsed", "f", "float32"),
+    ("ts", "d", "float64"),
+)
+
+class AttemptLog:
+    def __init__(self, folder=ATTEMPT_LOG_DIR, batch=8, interval=1.0):
+        self.folder = folder
+        self.batch = batch
+        self.interval = interval
+        self.pending = []
+        self.last_flush = time.time()
+        self._forget_names()
+        if os.path.exists(self._path("names.json")): self._migrate_names()
+
+    def _migrate_names(self):
+        """Splits the old names.json into one names file per kind."""
+        try:
+            with FileLock(self._path("lock")):
+                with open(self._path("names.json"), "r", encoding="utf-8") as f:
+                    old = json.load(f)
+                for kind in self.known:
+                    with open(self._path(f"{kind}.names"), "w", encoding="utf-8") as f:
+                        f.writelines(json.dumps(n) + "\n" for n in old.get(kind, []))
+                os.remove(self._path("names.json"))
+        except (OSError, ValueError) as e:
+            print("Warning: could not convert attempt log names:", e)
+
+    def _forget_names(self):
+        self.known = {"users": [], "ciphers": []}
+        self.ids = {"users": {}, "ciphers": {}}
+        self.offsets = {"users": 0, "ciphers": 0}  #Bytes of each names file already read
+
+    def _path(self, name): return os.path.join(self.folder, name)
+
+    def _read_names(self, kind):
+        """Picks up names other sessions appended since the last read. A torn
+        last line is left unread."""
+        try:
+            with open(self._path(f"{kind}.names"), "rb") as f:
+                f.seek(self.offsets[kind])
+                tail = f.read()
+        except OSError:
+            return
+        tail = tail[:tail.rfind(b"\n") + 1]
+        self.offsets[kind] += len(tail)
+        for line in tail.splitlines():
+            name = json.loads(line)
+            self.ids[kind][name] = len(self.known[kind])
+            self.known[kind].append(name)
+
+    def names(self):
+        """{"users": [...], "ciphers": [...]}; a name's id is its list index."""
+        for kind in self.known: self._read_names(kind)
+        return self.known
+
+    def append(self, user, cipher_name, correct, hints_used, elapsed_seconds, ts=None):
+        self.pending.append((user, cipher_name, 1 if correct else 0, hints_used,
+                             elapsed_seconds or 0.0, time.time() if ts is None else ts))
+        if len(self.pending) >= self.batch or time.time() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.pending: return
+        rows, self.pending = self.pending, []
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with FileLock(self._path("lock")):
+                # Ids are given out under the lock, so sessions never disagree.
+                # Only names not seen before are written, one line each.
+                self.names()
+                added = {kind: [] for kind in self.known}
+                cols = [array(code) for _, code, _ in ATTEMPT_COLUMNS]
+                for user, cipher_name, correct, hints, elapsed, ts in rows:
+                    ref = []
+                    for kind, name in (("users", user), ("ciphers", cipher_name)):
+                        if name not in self.ids[kind]:
+                            self.ids[kind][name] = len(self.known[kind])
+                            self.known[kind].append(name)
+                            added[kind].append(name)
+                        ref.append(self.ids[kind][name])
+                    for col, value in zip(cols, (ref[0], ref[1], correct, min(hints, 65535), elapsed, ts)):
+                        col.append(value)
+                for kind, new in added.items():
+                    if not new: continue
+                    data = "".join(json.dumps(n) + "\n" for n in new).encode("utf-8")
+                    with open(self._path(f"{kind}.names"), "ab") as f:
+                        f.truncate(self.offsets[kind])  #Drop a torn line left by a crash
+                        f.write(data)
+                    self.offsets[kind] += len(data)
+                # Cut every column back to the shortest first, so a torn last
+                # write can't leave later rows out of step.
+                full = self._row_count()
+                for (name, _, _), col in zip(ATTEMPT_COLUMNS, cols):
+                    with open(self._path(name), "ab") as f:
+                        f.truncate(full * col.itemsize)
+                        col.tofile(f)
+        except OSError as e:
+            self._forget_names()  #Reread from disk rather than trust ids that weren't saved
+            print("Warning: could not save attempt log:", e)
+
+    def _row_count(self):
+        """Rows every column file has in full."""
+        sizes = []
+        for name, code, _ in ATTEMPT_COLUMNS:
+            path = self._path(name)
+            sizes.append(os.path.getsize(path) // array(code).itemsize if os.path.exists(path) else 0)
+        return min(sizes)
+
+    def columns(self):
+        """Every column at its full length, as numpy memmaps or arrays. A torn
+        last write is cut off by using the shortest column's row count."""
+        rows = self._row_count()
+        out = {}
+        for name, code, dtype in ATTEMPT_COLUMNS:
+            if not rows:
+                out[name] = np.zeros(0, dtype=dtype) if np else array(code)
+            elif np:
+                out[name] = np.memmap(self._path(name), dtype=dtype, mode="r", shape=(rows,))
+            else:
+                col = array(code)
+                with open(self._path(name), "rb") as f:
+                    col.fromfile(f, rows)
+                out[name] = col
+        return out
+
+    def _rows(self, cols, user=None, cipher_name=None, correct=None):
+        """Boolean mask (numpy) or index list of the matching rows."""
+        names = self.names()
+        want = {}
+        for col, kind, name in (("user", "users", user), ("cipher", "ciphers", cipher_name)):
+            if name is None: continue
+            if name not in names[kind]: return np.zeros(len(cols["ts"]), dtype=bool) if np else []
+            want[col] = names[kind].index(name)
+        if correct is not None: want["correct"] = 1 if correct else 0
+        if np:
+            mask = np.ones(len(cols["ts"]), dtype=bool)
+            for col, value in want.items(): mask &= cols[col] == value
+            return mask
+        return [i for i in range(len(cols["ts"])) if all(cols[c][i] == v for c, v in want.items())]
+
+    def solve_times(self, user=None, cipher_name=None):
+        """Sorted elapsed seconds of the correct attempts that match."""
+        cols = self.columns()
+        rows = self._rows(cols, user, cipher_name, correct=True)
+        if np: return np.sort(cols["elapsed"][rows])
+        return sorted(cols["elapsed"][i] for i in rows)
+
+    def percentiles(self, qs=(50, 95), user=None, cipher_name=None):
+        times = self.solve_times(user, cipher_name)
+        return [None if v is None else float(v) for v in (percentile(times, q) for q in qs)]
+
+    def by_cipher(self, user=None, qs=(50, 95)):
+        """{cipher name: (attempts, correct, [percentiles of solve time])}."""
+        cols = self.columns()
+        ciphers = self.names()["ciphers"]
+        out = {}
+        base = self._rows(cols, user)
+        for cid, cipher_name in enumerate(ciphers):
+            if np:
+                rows = base & (cols["cipher"] == cid)
+                attempts = int(rows.sum())
+                solved = rows & (cols["correct"] == 1)
+                times = np.sort(cols["elapsed"][solved])
+            else:
+                rows = [i for i in base if cols["cipher"][i] == cid]
+                attempts = len(rows)
+                times = sorted(cols["elapsed"][i] for i in rows if cols["correct"][i])
+            if attempts:
+                out[cipher_name] = (attempts, len(times), [float(percentile(times, q)) if len(times) else None for q in qs])
+        return out
+
+    def rolling_accuracy(self, user, cipher_name=None, window=20):
+        """Accuracy over each run of window consecutive attempts, oldest first."""
+        cols = self.columns()
+        rows = self._rows(cols, user, cipher_name)
+        if np:
+            hits = cols["correct"][rows].astype(np.int64)
+            if len(hits) < window: return [float(hits.mean())] if len(hits) else []
+            sums = np.cumsum(np.concatenate(([0], hits)))
+            return ((sums[window:] - sums[:-window]) / window).tolist()
+        hits = [cols["correct"][i] for i in rows]
+        if len(hits) < window: return [sum(hits) / len(hits)] if hits else []
+        total = sum(hits[:window])
+        out = [total / window]
+        for i in range(window, len(hits)):
+            total += hits[i] - hits[i - window]
+            out.append(total / window)
+        return out
+
+_attempt_log = None
+
+def get_attempt_log():
+    global _attempt_log
+    if _attempt_log is None:
+        _attempt_log = AttemptLog()
+        atexit.register(_attempt_log.flush)
+    return _attempt_log
+
+# ------------------ #
+# Leaderboards: per cipher, each board is a list of (sort key, user) kept
+# sorted with bisect, plus user -> current sort key. An attempt moves one
+# entry (a bisect and an insort), and top-k is a slice, however many users.
+
+LEADERBOARD_MIN_ATTEMPTS = 5  #Attempts needed before a user is ranked on accuracy
+
+class Leaderboard:
+    BOARDS = ("accuracy", "fastest", "hint_free")
+
+    def __init__(self, stats=None):
+        self.boards = {}
+        for user, u in (stats or {}).items():
+            for cipher_name, c in u["ciphers"].items():
+                self.update(user, cipher_name, c)
+
+    @staticmethod
+    def _sort_key(board, c):
+        """Smaller sorts first. None means the user is not on this board."""
+        if board == "accuracy":
+            if c["attempts"] < LEADERBOARD_MIN_ATTEMPTS: return None
+            return (-c["correct"] / c["attempts"], -c["correct"])
+        if board == "fastest":
+            return (c["fastest"],) if c["fastest"] is not None else None
+        return (-c.get("hint_free", 0),) if c.get("hint_free") else None
+
+    @staticmethod
+    def _value(board, sort_key):
+        return sort_key[0] if board == "fastest" else -sort_key[0]
+
+    def update(self, user, cipher_name, c):
+        for board in self.BOARDS:
+            ranked, keys = self.boards.setdefault((cipher_name, board), ([], {}))
+            new = self._sort_key(board, c)
+            old = keys.get(user)
+            if old == new: continue
+            if old is not None:
+                del ranked[bisect_left(ranked, (old, user))]
+                del keys[user]
+            if new is not None:
+                insort(ranked, (new, user))
+                keys[user] = new
+
+    def top(self, cipher_name, board, k=10):
+        """[(user, value)] for the best k: accuracy as a fraction, fastest in seconds, hint-free solve count."""
+        ranked, _ = self.boards.get((cipher_name, board), ([], {}))
+        return [(user, self._value(board, key)) for key, user in ranked[:k]]
+
+    def rank(self, cipher_name, board, user):
+        """1-based position of user on a board, or None if they are not on it."""
+        ranked, keys = self.boards.get((cipher_name, board), ([], {}))
+        if user not in keys: return None
+        return bisect_left(ranked, (keys[user], user)) + 1
+
+    def size(self, cipher_name, board):
+        return len(self.boards.get((cipher_name, board), ((), {}))[0])
+
+_leaderboard = None
+
+def get_leaderboard(stats):
+    """Built from stats on first use, then kept current by record_attempt."""
+    global _leaderboard
+    if _leaderboard is None:
+        _leaderboard = Leaderboard(stats)
+    return _leaderboard
+
+# ------------------ #
+
+STREAM_CHUNK_SIZE = 1 << 16
+
+def read_chunks(f, size=STREAM_CHUNK_SIZE):
+    return iter(lambda: f.read(size), "")
+
+def _open_text(path, mode):
+    if path in (None, "-"):
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(path, mode, encoding="utf-8", newline="")
+
+def stream_file(cipher, key, src, dst, decrypt=False, chunk_size=STREAM_CHUNK_SIZE, wrap=0):
+    """Encrypts or decrypts src into dst a chunk at a time ('-' is stdin/stdout).
+    Returns the number of characters written (bytes for Base64, which works on raw files)."""
+    if isinstance(cipher, Base64Cipher):
+        return base64_file(src, dst, decrypt, wrap, chunk_size)
+    if isinstance(cipher, RailFence) and src not in (None, "-") and dst not in (None, "-"):
+        return rail_fence_file(src, dst, key, decrypt)
+    prepared = cipher.prepare(key)
+    written = 0
+    fin = _open_text(src, "r")
+    try:
+        fout = _open_text(dst, "w")
+        try:
+            for out in prepared.stream(read_chunks(fin, chunk_size), decrypt):
+                fout.write(out)
+                written += len(out)
+            fout.flush()
+        finally:
+            if fout is not sys.stdout: fout.close()
+    finally:
+        if fin is not sys.stdin: fin.close()
+    return written
+
+def read_binary_chunks(f, size=STREAM_CHUNK_SIZE):
+    """Yields memoryviews over one reused buffer; each is only valid until the next."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(buf)
+        if not n: return
+        yield view[:n]
+
+def _open_binary(path, mode):
+    if path in (None, "-"):
+        return sys.stdin.buffer if mode == "rb" else sys.stdout.buffer
+    return open(path, mode)
+
+def base64_file(src, dst, decrypt=False, wrap=0, chunk_size=STREAM_CHUNK_SIZE):
+    """Base64 encodes or decodes any file in constant memory ('-' is stdin/stdout).
+    Returns the number of bytes written."""
+    written = 0
+    fin = _open_binary(src, "rb")
+    try:
+        fout = _open_binary(dst, "wb")
+        try:
+            chunks = read_binary_chunks(fin, chunk_size)
+            out = b64_decode_stream(chunks) if decrypt else b64_encode_stream(chunks, wrap)
+            for piece in out:
+                fout.write(piece)
+                written += len(piece)
+            fout.flush()
+        finally:
+            if fout is not sys.stdout.buffer: fout.close()
+    finally:
+        if fin is not sys.stdin.buffer: fin.close()
+    return written
+
+# Out-of-core Rail Fence. The letters of any window of plaintext that fall
+# on one rail are a contiguous run of that rail's ciphertext, at an offset
+# that is plain arithmetic. So each window is moved with a few extended
+# slices per rail straight into (or out of) a memory-mapped file.
+
+RAIL_MEMORY_BUDGET = 64 << 20  #Bytes rail_fence_file may hold in memory at once
+
+def _rail_count(x, r, rails):
+    """How many of the positions below x are on rail r."""
+    period = 2 * (rails - 1)
+    n = max(0, (x - r + period - 1) // period)
+    if 0 < r < rails - 1:
+        n += max(0, (x - period + r + period - 1) // period)
+    return n
+
+def _rail_offsets(w0, rails):
+    """(down, up) offsets in a window starting at w0 of each rail's first letters."""
+    period = 2 * (rails - 1)
+    return [((r - w0) % period, (period - r - w0) % period) for r in range(rails)]
+
+def _sanitize_to(fin, fout, chunk_size=STREAM_CHUNK_SIZE):
+    n = 0
+    for chunk in read_binary_chunks(fin, chunk_size):
+        letters = as_bytes(chunk).translate(None, _NON_LETTER_BYTES).upper()
+        fout.write(letters)
+        n += len(letters)
+    return n
+
+def rail_fence_file(src, dst, rails, decrypt=False, budget=RAIL_MEMORY_BUDGET):
+    """Rail Fence on files of any size in about budget bytes of memory. The
+    input's letters are first copied to a temp file, then moved a window at a
+    time into an mmap of the output. Only ASCII letters are kept. Returns the
+    number of letters written."""
+    import mmap, tempfile
+    folder = os.path.dirname(os.path.abspath(dst))
+    with open(src, "rb") as fin, tempfile.TemporaryFile(dir=folder) as tmp:
+        n = _sanitize_to(fin, tmp)
+        tmp.flush()
+        with open(dst, "w+b") as fout:
+            if n == 0: return 0
+            fout.truncate(n)
+            with mmap.mmap(tmp.fileno(), n, access=mmap.ACCESS_READ) as text, \
+                 mmap.mmap(fout.fileno(), n) as out:
+                if rails <= 1:
+                    for w0 in range(0, n, budget): out[w0:w0 + budget] = text[w0:w0 + budget]
+                else:
+                    _rail_windows(text, out, n, rails, decrypt, max(budget // 4, 2 * rails))
+                out.flush()
+    return n
+
+def _rail_windows(text, out, n, rails, decrypt, window):
+    import mmap
+    period = 2 * (rails - 1)
+    starts = [0]
+    for r in range(rails - 1): starts.append(starts[-1] + _rail_count(n, r, rails))
+    for w0 in range(0, n, window):
+        w1 = min(n, w0 + window)
+        plain = bytearray(w1 - w0) if decrypt else text[w0:w1]
+        for r, (a, b) in enumerate(_rail_offsets(w0, rails)):
+            lo = starts[r] + _rail_count(w0, r, rails)
+            hi = starts[r] + _rail_count(w1, r, rails)
+            edge = r == 0 or r == rails - 1
+            first, second = (a, b) if a < b else (b, a)
+            if decrypt:
+                run = text[lo:hi]
+                if edge:
+                    plain[a::period] = run
+                else:
+                    plain[first::period] = run[0::2]
+                    plain[second::period] = run[1::2]
+            elif edge:
+                out[lo:hi] = plain[a::period]
+            else:
+                run = bytearray(hi - lo)
+                run[0::2] = plain[first::period]
+                run[1::2] = plain[second::period]
+                out[lo:hi] = bytes(run)
+        if decrypt: out[w0:w1] = bytes(plain)
+        if hasattr(mmap, "MADV_DONTNEED"):
+            # Written pages are already in the page cache; unmapping them keeps
+            # the process's resident size near the budget too.
+            out.madvise(mmap.MADV_DONTNEED)
+            text.madvise(mmap.MADV_DONTNEED)
+
+def find_cipher(name):
+    cipher = CIPHER_REGISTRY.find(name)
+    if cipher is not None: return cipher
+    raise ValueError(f"Unknown cipher: {name}")
+
+def parse_key(cipher, k_in):
+    """Parses a typed key the way input mode accepts it. Raises ValueError if invalid."""
+    try:
+        if "int" in cipher.key_desc or "Shift" in cipher.key_desc:
+            return int(k_in)
+        elif "Pair" in cipher.key_desc: # Affine
+            parts = k_in.replace(',',' ').split()
+            return (int(parts[0]), int(parts[1]))
+        elif "Matrix" in cipher.key_desc:
+            parts = [int(p) for p in k_in.replace(',',' ').replace('[',' ').replace(']',' ').split()]
+            n = getattr(cipher, "n", 2)
+            if len(parts) != n * n: raise ValueError
+            return [parts[i*n:(i+1)*n] for i in range(n)]
+        elif "Map" in cipher.key_desc:
+            if len(k_in) != 26: raise ValueError
+            return {ALPHABET[i]: k_in.upper()[i] for i in range(26)}
+        elif cipher.key_desc == "None":
+            return None
+        return k_in
+    except (ValueError, IndexError):
+        raise ValueError("Invalid key format.")
+
+def ask_key(cipher):
+    """Prompts for a key. Returns (ok, key)."""
+    if cipher.key_desc == "None": return True, None
+    k_in = prompt(f"Enter Key ({cipher.key_desc}): ").strip()
+    if k_in.lower() == "random":
+        key = cipher.generate_key()
+        print(f"Using random key: {cipher.format_key(key)}")
+        return True, key
+    try:
+        return True, parse_key(cipher, k_in)
+    except ValueError:
+        print("Invalid key format.")
+        return False, None
 
 # ------------------ #
 def give_hint(expected, reveal=3):
@@ -470,29 +2840,97 @@ def give_hint(expected, reveal=3):
     reveal = min(reveal, len(s))
     return f"Hint: starts with '{s[:reveal]}...'"
 
+PUZZLE_PREFETCH = 3
+
+def make_puzzle(cipher):
+    """Picks a phrase, key and direction; returns the puzzle as a JSON-friendly dict."""
+    phrase = PhraseManager.get_phrase()
+    encode = random.choice([True, False])
+    key = cipher.generate_key()
+    secret = cipher.encrypt(phrase, key)
+    return {
+        "cipher": cipher.name,
+        "encode": encode,
+        "challenge": phrase if encode else secret,
+        "answer": secret if encode else phrase,
+        "key": key,
+        "display_key": cipher.format_key(key) if key is not None else "N/A",
+    }
+
+def _open_puzzles(path, mode):
+    if path.endswith(".gz"):
+        import gzip, io
+        # mtime=0 so the same seed gives a byte-identical file
+        return io.TextIOWrapper(gzip.GzipFile(path, mode + "b", mtime=0), encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def read_puzzles(path, cipher_name=None):
+    """Yields the puzzles in a generated file, optionally only one cipher's."""
+    with _open_puzzles(path, "r") as f:
+        for line in f:
+            if not line.strip(): continue
+            puzzle = json.loads(line)
+            if cipher_name is None or puzzle.get("cipher") == cipher_name:
+                yield puzzle
+
+class PuzzlePrefetcher:
+    """Keeps the next few puzzles ready on a background thread. Puzzles are
+    taken from source (an iterable of puzzle dicts) first, then made fresh."""
+    def __init__(self, cipher, depth=PUZZLE_PREFETCH, source=None):
+        import queue
+        self.cipher = cipher
+        self.source = iter(source) if source is not None else iter(())
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._fill, daemon=True)
+        self.thread.start()
+
+    def _fill(self):
+        import queue
+        while not self.stopped.is_set():
+            try:
+                item = next(self.source, None) or make_puzzle(self.cipher)
+            except Exception as e:
+                item = e
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if isinstance(item, Exception): return
+
+    def get(self):
+        item = self.queue.get()
+        if isinstance(item, Exception): raise item
+        return item
+
+    def close(self):
+        self.stopped.set()
+
 def practice_mode(stats, user, cipher):
     banner_page()
     print(f"Practice: {cipher.name}")
     print("Type 'hint' for a clue, 'skip' to pass, 'quit' to exit.")
 
-    while True:
-        phrase = PhraseManager.get_phrase()
-        is_encode = random.choice([True, False])
-        key = cipher.generate_key()
+    source = read_puzzles(PUZZLE_FILE, cipher.name) if PUZZLE_FILE and os.path.exists(PUZZLE_FILE) else None
+    puzzles = PuzzlePrefetcher(cipher, source=source)
+    try:
+        _practice_loop(stats, user, cipher, puzzles)
+    finally:
+        puzzles.close()
 
+def _practice_loop(stats, user, cipher, puzzles):
+    while True:
         try:
-            if is_encode:
+            puzzle = puzzles.get()
+            if puzzle["encode"]:
                 prompt_text = f"Encode this using {cipher.name}"
-                challenge_text = phrase
-                target_display = cipher.encrypt(phrase, key)
-                comparison_target = sanitize_letters(target_display)
-                display_key = cipher.format_key(key) if key is not None else "N/A"
             else:
                 prompt_text = f"Decode this from {cipher.name}"
-                challenge_text = cipher.encrypt(phrase, key)
-                target_display = phrase 
-                comparison_target = sanitize_letters(phrase)
-                display_key = cipher.format_key(key) if key is not None else "N/A"
+            challenge_text = puzzle["challenge"]
+            target_display = puzzle["answer"]
+            comparison_target = sanitize_letters(target_display)
 
             print(f"\n{prompt_text}")
             print(f"Text: {challenge_text}")
@@ -546,30 +2984,8 @@ def input_mode(stats, user, cipher):
         msg = prompt("\nEnter message (or 'quit'): ")
         if msg.lower() in ("quit", ""): return
 
-        key = None
-        if cipher.key_desc != "None":
-            k_in = prompt(f"Enter Key ({cipher.key_desc}): ").strip()
-            if k_in.lower() == "random":
-                key = cipher.generate_key()
-                print(f"Using random key: {cipher.format_key(key)}")
-            else:
-                try:
-                    if "int" in cipher.key_desc or "Shift" in cipher.key_desc:
-                        key = int(k_in)
-                    elif "Pair" in cipher.key_desc: # Affine
-                        parts = k_in.replace(',',' ').split()
-                        key = (int(parts[0]), int(parts[1]))
-                    elif "Matrix" in cipher.key_desc:
-                        parts = k_in.replace(',',' ').split()
-                        key = [[int(parts[0]), int(parts[1])], [int(parts[2]), int(parts[3])]]
-                    elif "Map" in cipher.key_desc:
-                        if len(k_in) != 26: raise ValueError
-                        key = {ALPHABET[i]: k_in.upper()[i] for i in range(26)}
-                    else:
-                        key = k_in
-                except:
-                    print("Invalid key format.")
-                    continue
+        ok, key = ask_key(cipher)
+        if not ok: continue
 
         mode = prompt("Encode (e) or Decode (d)? ").lower()
         try:
@@ -581,6 +2997,55 @@ def input_mode(stats, user, cipher):
         except Exception as e:
             print(f"Error: {e}")
 
+def file_mode(stats, user, cipher):
+    banner_page()
+    print(f"File Mode: {cipher.name}")
+    print(f"Key Format: {cipher.key_desc}")
+    print("Files are processed in chunks, so they can be any size.")
+
+    while True:
+        src = prompt("\nInput file (or 'quit'): ").strip()
+        if src.lower() in ("quit", ""): return
+        if not os.path.exists(src):
+            print("File not found.")
+            continue
+        dst = prompt("Output file: ").strip()
+        if not dst: continue
+
+        ok, key = ask_key(cipher)
+        if not ok: continue
+
+        mode = prompt("Encode (e) or Decode (d)? ").lower()
+        try:
+            start_t = time.time()
+            n = stream_file(cipher, key, src, dst, decrypt=mode.startswith('d'))
+            print(f"Wrote {n} characters to {dst} ({time.time() - start_t:.2f}s)")
+        except Exception as e:
+            print(f"Error: {e}")
+
+def crack_mode(stats, user, cipher):
+    banner_page()
+    print(f"Crack Mode: {cipher.name}")
+    print("Every key is tried and ranked by how English the result looks.")
+
+    while True:
+        msg = prompt("\nEnter ciphertext (or 'quit'): ")
+        if msg.lower() in ("quit", ""): return
+        crib = prompt("Known plaintext, if any (Enter to skip): ").strip() if isinstance(cipher, Hill) else ""
+        if crib:
+            results = hill_crib_attack(msg, crib, cipher.n, top=5)
+        elif cipher.name in SOLVERS or cipher.key_space() is not None:
+            results = crack(cipher, msg, top=5)
+        else:
+            print("This cipher needs some known plaintext to crack.")
+            continue
+        if not results: print("No key found.")
+        print(f"{'Key':<15} | {'Score':<10} | Plaintext")
+        print("-" * 75)
+        for key, score in results:
+            shown = cipher.format_key(key) if key is not None else "N/A"
+            print(f"{shown:<15} | {score:<10.1f} | {cipher.decrypt(msg, key)}")
+
 # ------------------ #
 def show_stats(stats, user):
     banner_page()
@@ -589,17 +3054,50 @@ def show_stats(stats, user):
     print(f"\nStats for {user}")
     print(f"Total Attempts: {u['total_attempts']} | Accuracy: {(u['total_correct']/(u['total_attempts'] or 1))*100:.1f}%")
 
+    get_attempt_log().flush()
+    times = get_attempt_log().by_cipher(user)
     print("\n" + "="*75)
-    print(f"{'Cipher':<15} | {'Score':<10} | {'Fastest':<10} | {'Hints'}")
+    print(f"{'Cipher':<15} | {'Score':<10} | {'Fastest':<10} | {'Median':<10} | {'p95':<10} | {'Hints'}")
     print("-" * 75)
 
     for c_name, data in u["ciphers"].items():
         score = f"{data['correct']}/{data['attempts']}"
         fast = f"{data['fastest']:.2f}s" if data['fastest'] else "--"
-        print(f"{c_name:<15} | {score:<10} | {fast:<10} | {data['hints']}")
+        median, p95 = times.get(c_name, (0, 0, [None, None]))[2]
+        median = f"{median:.2f}s" if median is not None else "--"
+        p95 = f"{p95:.2f}s" if p95 is not None else "--"
+        print(f"{c_name:<15} | {score:<10} | {fast:<10} | {median:<10} | {p95:<10} | {data['hints']}")
     print("="*75 + "\n")
     prompt("Enter to continue...")
 
+def show_leaderboard(stats, user=None, k=10):
+    board = get_leaderboard(stats)
+    banner_page()
+    for i, c in enumerate(CIPHER_REGISTRY):
+        print(f"{i+1}. {c.name}")
+    sel = prompt("Cipher: ").strip()
+    if not (sel.isdigit() and 1 <= int(sel) <= len(CIPHER_REGISTRY)): return
+    cipher_name = CIPHER_REGISTRY[int(sel)-1].name
+
+    banner_page()
+    print(f"Leaderboard: {cipher_name}")
+    shown = {"accuracy": ("Accuracy", lambda v: f"{v*100:.1f}%"),
+             "fastest": ("Fastest", lambda v: f"{v:.2f}s"),
+             "hint_free": ("Hint-free solves", str)}
+    for name in Leaderboard.BOARDS:
+        title, fmt = shown[name]
+        print("\n" + "="*40)
+        print(f"{title} ({board.size(cipher_name, name)} ranked)")
+        print("-" * 40)
+        for pos, (u, value) in enumerate(board.top(cipher_name, name, k), 1):
+            print(f"{pos:>3}. {u:<22} {fmt(value)}")
+        if user:
+            rank = board.rank(cipher_name, name, user)
+            if rank is not None and rank > k: print(f"  You: #{rank}")
+    if LEADERBOARD_MIN_ATTEMPTS > 1:
+        print(f"\nAccuracy needs {LEADERBOARD_MIN_ATTEMPTS} attempts to be ranked.")
+    prompt("Enter to continue...")
+
 def main():
     stats = load_stats()
     current_user = None
@@ -610,8 +3108,9 @@ def main():
         print("1. Login")
         print("2. Ciphers")
         print("3. Stats")
-        print("4. About")
-        print("5. Quit")
+        print("4. Leaderboard")
+        print("5. About")
+        print("6. Quit")
 
         choice = prompt("Select: ").strip().lower()
 
@@ -639,25 +3138,793 @@ def main():
                     cipher = CIPHER_REGISTRY[int(sel)-1]
                     banner_page()
                     print(f"Cipher: {cipher.name}")
-                    print("1. Practice\n2. Input Mode")
+                    print("1. Practice\n2. Input Mode\n3. File Mode")
+                    if can_crack(cipher): print("4. Crack")
                     sub = prompt("Mode: ")
                     if sub == "1": practice_mode(stats, current_user, cipher)
                     elif sub == "2": input_mode(stats, current_user, cipher)
+                    elif sub == "3": file_mode(stats, current_user, cipher)
+                    elif sub == "4" and can_crack(cipher): crack_mode(stats, current_user, cipher)
 
         elif choice == "3":
             if current_user: show_stats(stats, current_user)
             else: print("Login first!")
 
         elif choice == "4":
+            show_leaderboard(stats, current_user)
+
+        elif choice == "5":
             banner_page()
             print("--- Cipher Terminal v1.0 ---")
             print("This is Version 1.0 of a hobby project to practice and learn cryptography better. \nIn the future, more ciphers will be added as well as bug fixes, updated systems and UI, redesigns, and more. ")
             prompt("Enter to continue...")
 
-        elif choice in ("5", "quit"):
+        elif choice in ("6", "quit"):
             save_stats(stats)
             sys.exit()
 
-if __name__ == "__main__":
+# ------------------ #
+# Benchmarks: encrypt and decrypt for every cipher over a range of input
+# sizes and kinds of text. Results can be saved as a baseline and later
+# runs compared against it.
+
+BENCH_SIZES = [50, 1000, 100_000, 1_000_000]
+BENCH_KINDS = ("letters", "mixed", "unicode")
+BENCH_MIN_TIME = 0.2
+BENCH_MAX_CALLS = 1000
+BENCH_WARMUP = 0.05  #Seconds of untimed calls before measuring
+
+def parse_size(s):
+    """'50', '10k' or '100M' as a number of characters."""
+    s = s.strip().lower()
+    scale = {"k": 1000, "m": 1000_000, "g": 1000_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if scale > 1 else s) * scale)
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list, q in 0..100."""
+    if not len(sorted_values): return None
+    i = max(0, min(len(sorted_values) - 1, ceil(q * len(sorted_values) / 100) - 1))
+    return sorted_values[i]
+
+def bench_text(kind, size):
+    """Deterministic benchmark input: English letters only, mixed case with
+    punctuation and digits, or mixed text with non-ASCII characters."""
+    words = " ".join(PhraseManager.INTERNAL_LIBRARY).split()
+    rng = random.Random(kind)
+    if kind == "letters":
+        block = "".join(words)
+    elif kind == "mixed":
+        block = " ".join(w.capitalize() + rng.choice(["", "", ",", ".", "!", " 42", "?"]) for w in words)
+    else:
+        block = " ".join(w.lower() + rng.choice(["", "é", "ß", " –", "…", " 😀", "ñ"]) for w in words)
+    return (block * (size // len(block) + 1))[:size]
+
+def bench_one(fn, text, min_time=BENCH_MIN_TIME, max_calls=BENCH_MAX_CALLS, memory=True):
+    """Times fn(text) after BENCH_WARMUP seconds (at least one call) of untimed
+    warm-up for key preparation, caches and CPU clocks. chars_per_sec comes from
+    the median call, which is far steadier between runs than the mean."""
+    warm_until = time.perf_counter() + BENCH_WARMUP
+    fn(text)
+    while time.perf_counter() < warm_until: fn(text)
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_calls:
+        t0 = time.perf_counter()
+        fn(text)
+        latencies.append(time.perf_counter() - t0)
+        if time.perf_counter() - start >= min_time: break
+    latencies.sort()
+    p50 = percentile(latencies, 50)
+    result = {
+        "calls": len(latencies),
+        "chars_per_sec": len(text) / p50 if p50 else None,
+        "p50_ms": p50 * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+        fn(text)
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+def run_benchmarks(ciphers=None, sizes=BENCH_SIZES, kinds=BENCH_KINDS, memory=True, out=sys.stdout):
+    """Returns {"cipher|kind|size|op": result} and prints a table as it goes."""
+    ciphers = ciphers or CIPHER_REGISTRY
+    results = {}
+    print(f"{'Cipher':<15} {'Text':<8} {'Size':>10} {'Op':<8} {'chars/s':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KB':>9}", file=out)
+    for cipher in ciphers:
+        random.seed(0)
+        key = cipher.generate_key()
+        for kind in kinds:
+            for size in sizes:
+                text = bench_text(kind, size)
+                ops = [("encrypt", lambda t: cipher.encrypt(t, key), text),
+                       ("decrypt", lambda t: cipher.decrypt(t, key), cipher.encrypt(text, key))]
+                for op, fn, arg in ops:
+                    r = bench_one(fn, arg, memory=memory)
+                    results[f"{cipher.name}|{kind}|{size}|{op}"] = r
+                    peak = f"{r['peak_bytes'] / 1024:9.0f}" if memory else f"{'--':>9}"
+                    cps = r["chars_per_sec"] or 0
+                    print(f"{cipher.name:<15} {kind:<8} {size:>10} {op:<8} {cps:>12,.0f} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} {peak}", file=out)
+    return results
+
+def compare_benchmarks(baseline, results, threshold=0.10):
+    """Entries whose chars/sec (from the median call) fell by more than threshold
+    (a fraction) since baseline. Returns [(name, old, new), ...]."""
+    slower = []
+    for name, r in results.items():
+        old = baseline.get(name)
+        if not old or not old.get("chars_per_sec") or not r.get("chars_per_sec"): continue
+        if r["chars_per_sec"] < old["chars_per_sec"] * (1 - threshold):
+            slower.append((name, old["chars_per_sec"], r["chars_per_sec"]))
+    return slower
+
+def cmd_bench(args):
+    ciphers = [find_cipher(name) for name in args.cipher] if args.cipher else None
+    sizes = [parse_size(x) for x in args.sizes.split(",")]
+    kinds = args.kinds.split(",")
+    for kind in kinds:
+        if kind not in BENCH_KINDS: raise ValueError(f"Unknown text kind: {kind}")
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    results = run_benchmarks(ciphers, sizes, kinds, memory=not args.no_memory)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "numpy": bool(np), "results": results}, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if baseline is not None:
+        slower = compare_benchmarks(baseline, results, args.threshold)
+        for name, old, new in slower:
+            print(f"REGRESSION {name}: {old:,.0f} -> {new:,.0f} chars/s ({(new / old - 1) * 100:+.1f}%)")
+        if slower: return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+# ------------------ #
+# Metrics: call counts, input sizes and latency histograms for the cipher
+# calls, phrase picks and stats I/O. Nothing is wrapped until enable_metrics()
+# runs (or CIPHER_TERMINAL_METRICS is set), so when off it costs nothing.
+# Cipher calls are timed on the registry's ciphers and on every PreparedKey
+# class, so prepared keys, streams, pipelines and batches all count. Batch and
+# service pool workers send their counts back with each result.
+
+METRICS_ENV = "CIPHER_TERMINAL_METRICS"  #File prefix for <prefix>.json and <prefix>.prom
+LATENCY_BUCKETS = (0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.local = threading.local()
+        self.prefix = None
+        self.installed = False
+        self.pid = os.getpid()
+
+    def observe(self, op, target, seconds, size=0):
+        with self.lock:
+            m = self.series.get((op, target))
+            if m is None:
+                m = self.series[op, target] = {"calls": 0, "size": 0, "seconds": 0.0,
+                                               "buckets": [0] * len(LATENCY_BUCKETS)}
+            m["calls"] += 1
+            m["size"] += size
+            m["seconds"] += seconds
+            i = bisect_left(LATENCY_BUCKETS, seconds)
+            if i < len(LATENCY_BUCKETS): m["buckets"][i] += 1
+
+    def wrap(self, fn, op, target, sized=False):
+        """fn timed under (op, target). Nested timed calls (ROT13.decrypt calling
+        encrypt) only count the outermost one."""
+        def timed(*args, **kwargs):
+            if getattr(self.local, "busy", False): return fn(*args, **kwargs)
+            self.local.busy = True
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.local.busy = False
+                size = len(args[0]) if sized and args and hasattr(args[0], "__len__") else 0
+                self.observe(op, target, time.perf_counter() - t0, size)
+        timed.__wrapped__ = fn
+        return timed
+
+    def wrap_prepared(self, fn, op):
+        """A PreparedKey method timed under (op, its cipher's name). stream is
+        timed chunk by chunk as the generator is read."""
+        def target(prepared): return prepared.cipher.name if prepared.cipher is not None else "Pipeline"
+        if op == "stream":
+            def timed(prepared, chunks, *args, **kwargs):
+                it = fn(prepared, chunks, *args, **kwargs)
+                while True:
+                    outer = not getattr(self.local, "busy", False)
+                    if outer:
+                        self.local.busy = True
+                        t0 = time.perf_counter()
+                    try:
+                        out = next(it, None)
+                    finally:
+                        if outer: self.local.busy = False
+                    if out is None: return
+                    if outer: self.observe(op, target(prepared), time.perf_counter() - t0, len(out))
+                    yield out
+        else:
+            def timed(prepared, data, *args, **kwargs):
+                if getattr(self.local, "busy", False): return fn(prepared, data, *args, **kwargs)
+                self.local.busy = True
+                t0 = time.perf_counter()
+                try:
+                    return fn(prepared, data, *args, **kwargs)
+                finally:
+                    self.local.busy = False
+                    if op == "batch": size = sum(map(len, data)) if isinstance(data, list) else 0
+                    else: size = len(data) if hasattr(data, "__len__") else 0
+                    self.observe(op, target(prepared), time.perf_counter() - t0, size)
+        timed.__wrapped__ = fn
+        return timed
+
+    def drain(self):
+        """Takes the counts recorded so far, leaving this process's empty. A
+        forked worker first drops what it inherited from its parent."""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.series = {}
+            series, self.series = self.series, {}
+        return series
+
+    def merge(self, series):
+        with self.lock:
+            for key, m in series.items():
+                mine = self.series.get(key)
+                if mine is None:
+                    self.series[key] = m
+                    continue
+                for k in ("calls", "size", "seconds"): mine[k] += m[k]
+                mine["buckets"] = [a + b for a, b in zip(mine["buckets"], m["buckets"])]
+
+    def install(self):
+        if self.installed: return
+        self.installed = True
+        for cipher in CIPHER_REGISTRY:
+            cipher.encrypt = self.wrap(cipher.encrypt, "encrypt", cipher.name, sized=True)
+            cipher.decrypt = self.wrap(cipher.decrypt, "decrypt", cipher.name, sized=True)
+        classes = [PreparedKey]
+        for cls in classes:
+            classes.extend(cls.__subclasses__())
+            for op in ("encrypt", "decrypt", "encrypt_into", "decrypt_into", "batch", "stream"):
+                if op in cls.__dict__: setattr(cls, op, self.wrap_prepared(cls.__dict__[op], op))
+        PhraseManager.get_phrase = staticmethod(self.wrap(PhraseManager.get_phrase, "get_phrase", "phrases"))
+        g = globals()
+        for name in ("load_stats", "save_stats"):
+            g[name] = self.wrap(g[name], name, "stats")
+        store = get_stats_store()
+        store.record = self.wrap(store.record, "stats_record", "stats")
+        store.flush = self.wrap(store.flush, "stats_flush", "stats")
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(op=op, target=target, **{k: (list(v) if k == "buckets" else v) for k, v in m.items()})
+                    for (op, target), m in sorted(self.series.items())]
+
+    def prometheus(self):
+        def labels(row, extra=""):
+            esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"')
+            return f'{{op="{esc(row["op"])}",target="{esc(row["target"])}"{extra}}}'
+        rows = self.snapshot()
+        lines = ["# HELP cipher_terminal_calls_total Calls per operation.",
+                 "# TYPE cipher_terminal_calls_total counter"]
+        lines += [f"cipher_terminal_calls_total{labels(r)} {r['calls']}" for r in rows]
+        lines += ["# HELP cipher_terminal_input_size_total Characters (or bytes) passed in.",
+                  "# TYPE cipher_terminal_input_size_total counter"]
+        lines += [f"cipher_terminal_input_size_total{labels(r)} {r['size']}" for r in rows]
+        lines += ["# HELP cipher_terminal_latency_seconds Call latency.",
+                  "# TYPE cipher_terminal_latency_seconds histogram"]
+        for r in rows:
+            running = 0
+            overflow = r["calls"] - sum(r["buckets"])
+            for le, n in zip(LATENCY_BUCKETS + ("+Inf",), r["buckets"] + [overflow]):
+                running += n
+                bucket = labels(r, ',le="%s"' % le)
+                lines.append(f"cipher_terminal_latency_seconds_bucket{bucket} {running}")
+            lines.append(f"cipher_terminal_latency_seconds_sum{labels(r)} {r['seconds']}")
+            lines.append(f"cipher_terminal_latency_seconds_count{labels(r)} {r['calls']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, prefix=None):
+        """Writes <prefix>.json and <prefix>.prom."""
+        prefix = prefix or self.prefix
+        if not prefix: return
+        with open(prefix + ".json", "w", encoding="utf-8") as f:
+            json.dump({"buckets": LATENCY_BUCKETS, "series": self.snapshot()}, f, indent=2)
+        with open(prefix + ".prom", "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+
+METRICS = Metrics()
+
+def enable_metrics(prefix):
+    """Turns metrics on and writes them at exit, and on SIGUSR1 where available."""
+    METRICS.prefix = prefix
+    METRICS.install()
+    atexit.register(METRICS.dump)
+    import signal
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda *_: METRICS.dump())
+
+def dump_metrics(prefix=None):
+    METRICS.dump(prefix)
+
+def _metered(fn, *args):
+    """Runs fn in a pool worker and returns (result, metrics it recorded)."""
+    METRICS.drain()
+    result = fn(*args)
+    return result, METRICS.drain()
+
+def _pool_submit(pool, fn, *args):
+    """pool.submit that brings worker metrics home when metrics are on; read
+    the result back with _pool_result."""
+    if METRICS.installed: return pool.submit(_metered, fn, *args)
+    return pool.submit(fn, *args)
+
+def _pool_result(result):
+    if not METRICS.installed: return result
+    result, series = result
+    METRICS.merge(series)
+    return result
+
+if os.environ.get(METRICS_ENV):
+    enable_metrics(os.environ[METRICS_ENV])
+
+# ------------------ #
+
+def cmd_stream(args):
+    cipher = find_cipher(args.cipher)
+    if args.key is None or args.key.lower() == "random":
+        key = cipher.generate_key()
+        if key is not None: print(f"Using random key: {cipher.format_key(key)}", file=sys.stderr)
+    else:
+        key = parse_key(cipher, args.key)
+    stream_file(cipher, key, args.input, args.output, args.decrypt, args.chunk_size, args.wrap)
+    return 0
+
+# Batch mode: one JSON job per line in, one JSON result per line out.
+#   {"id": 1, "cipher": "caesar", "key": "3", "mode": "encrypt", "text": "..."}
+# Keys can be typed the way input mode takes them ("3", "5,8", "LEMON",
+# "1 2 3 5") or given as JSON (3, [5, 8], [[1, 2], [3, 5]], {"A": "Q", ...}).
+
+BATCH_CHUNK_SIZE = 1000
+
+def job_key(cipher, key):
+    if cipher.key_desc == "None": return None
+    if isinstance(key, str):
+        if key.lower() == "random": return cipher.generate_key()
+        return parse_key(cipher, key)
+    if key is None: raise ValueError("Missing key")
+    return key
+
+def run_job(job):
+    """Runs one decoded job dict and returns the result dict."""
+    out = {"id": job.get("id")}
+    try:
+        cipher = find_cipher(job["cipher"])
+        key = job_key(cipher, job.get("key"))
+        mode = str(job.get("mode", "encrypt")).lower()
+        if mode.startswith("d"):
+            out["result"] = cipher.decrypt(job["text"], key)
+        elif mode.startswith("e"):
+            out["result"] = cipher.encrypt(job["text"], key)
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+        if isinstance(job.get("key"), str) and job["key"].lower() == "random":
+            out["key"] = key
+    except KeyError as e:
+        out["error"] = f"Missing field: {e.args[0]}"
+    except Exception as e:
+        out["error"] = str(e)
+    return out
 
+def run_job_lines(lines):
+    """Worker side of batch mode: JSON lines in, JSON lines out, same order."""
+    results = []
+    for line in lines:
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict): raise ValueError("Job must be a JSON object")
+            out = run_job(job)
+        except ValueError as e:
+            out = {"id": None, "error": f"Bad job: {e}"}
+        results.append(json.dumps(out, ensure_ascii=False) + "\n")
+    return results
+
+def _job_chunks(f, size):
+    chunk = []
+    for line in f:
+        if not line.strip(): continue
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk: yield chunk
+
+def run_batch(fin, fout, workers=None, chunk_size=BATCH_CHUNK_SIZE, ordered=True):
+    """Runs every job in fin across a process pool, a chunk of lines per task.
+    Results are written in input order, or as chunks finish when ordered=False.
+    Only a few chunks per worker are in flight, so memory stays bounded."""
+    chunks = _job_chunks(fin, chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            fout.writelines(run_job_lines(chunk))
+        return
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    workers = workers or os.cpu_count() or 1  #The pool's own default, without reading its private field
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        limit = 4 * workers
+        pending = deque()
+        for chunk in chunks:
+            pending.append(_pool_submit(pool, run_job_lines, chunk))
+            while len(pending) >= limit:
+                if ordered:
+                    fout.writelines(_pool_result(pending.popleft().result()))
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        pending.remove(f)
+                        fout.writelines(_pool_result(f.result()))
+        if ordered:
+            for f in pending: fout.writelines(_pool_result(f.result()))
+        else:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    pending.remove(f)
+                    fout.writelines(_pool_result(f.result()))
+
+def cmd_batch(args):
+    fin = _open_text(args.input, "r")
+    fout = _open_text(args.output, "w")
+    try:
+        run_batch(fin, fout, args.workers, args.chunk_size, ordered=not args.unordered)
+        fout.flush()
+    finally:
+        if fin is not sys.stdin: fin.close()
+        if fout is not sys.stdout: fout.close()
+    return 0
+
+def cmd_identify(args):
+    fin = _open_text(args.input, "r")
+    fout = _open_text(args.output, "w")
+    try:
+        while True:
+            lines = [line.rstrip("\r\n") for line in islice(fin, BATCH_CHUNK_SIZE)]
+            if not lines: break
+            for line, guesses in zip(lines, identify_batch(lines, args.top)):
+                fout.write(json.dumps({"text": line[:60], "guesses": [[name, round(p, 4)] for name, p in guesses]},
+                                      ensure_ascii=False) + "\n")
+        fout.flush()
+    finally:
+        if fin is not sys.stdin: fin.close()
+        if fout is not sys.stdout: fout.close()
+    return 0
+
+# Generate: N puzzles per cipher into a (gzipped) JSONL file for practice
+# mode. Puzzle i of a cipher is seeded with "<seed>:<cipher>:<i>", so the
+# output is the same however the work is split across processes.
+
+PUZZLE_CHUNK_SIZE = 500
+
+def make_puzzles(cipher_name, seed, start, stop):
+    """Worker side of generate: puzzles start..stop-1 of one cipher as JSON lines."""
+    cipher = find_cipher(cipher_name)
+    lines = []
+    for i in range(start, stop):
+        random.seed(f"{seed}:{cipher.name}:{i}")
+        puzzle = make_puzzle(cipher)
+        puzzle["id"] = i
+        lines.append(json.dumps(puzzle, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return lines
+
+def generate_puzzles(path, ciphers, count, seed=0, workers=None, chunk_size=PUZZLE_CHUNK_SIZE):
+    """Writes count puzzles for each cipher to path. Returns the number written."""
+    tasks = [(c.name, seed, i, min(i + chunk_size, count)) for c in ciphers for i in range(0, count, chunk_size)]
+    with _open_puzzles(path, "w") as f:
+        if workers == 1 or len(tasks) <= 1:
+            for task in tasks: f.writelines(make_puzzles(*task))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for lines in pool.map(make_puzzles, *zip(*tasks)):
+                    f.writelines(lines)
+    return count * len(ciphers)
+
+def cmd_generate(args):
+    ciphers = [find_cipher(c) for c in args.cipher] if args.cipher else CIPHER_REGISTRY
+    start_t = time.time()
+    n = generate_puzzles(args.output, ciphers, args.count, args.seed, args.workers)
+    print(f"Wrote {n} puzzles to {args.output} ({time.time() - start_t:.2f}s)", file=sys.stderr)
+    return 0
+
+# Service mode: a small HTTP/1.1 JSON server on localhost built on asyncio.
+#   GET  /ciphers
+#   POST /encrypt, /decrypt   {"cipher": "vigenere", "key": "LEMON", "text": "..."}
+#   POST /generate_key        {"cipher": "hill"}
+# Requests for the same cipher, key and direction that arrive within
+# batch_window seconds go to the worker pool as one PreparedKey.batch call.
+
+SERVE_PORT = 8765
+SERVE_MAX_BODY = 1 << 20
+SERVE_IDLE_TIMEOUT = 30.0
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 503: "Service Unavailable"}
+
+def run_text_batch(cipher_name, key, decrypt, texts):
+    """Worker side of service mode: one engine call for a group of texts.
+    Returns (ok, result or error message) per text, so one bad text only
+    fails its own request."""
+    prepared = find_cipher(cipher_name).prepare(key)
+    try:
+        return [(True, r) for r in prepared.batch(texts, decrypt)]
+    except Exception:
+        pass
+    out = []
+    for text in texts:
+        try:
+            out.append((True, prepared.batch([text], decrypt)[0]))
+        except Exception as e:
+            out.append((False, str(e)))
+    return out
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class CipherService:
+    def __init__(self, workers=None, max_connections=256, max_pending=1024,
+                 batch_window=0.002, max_batch=256):
+        self.workers = workers
+        self.max_connections = max_connections
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.connections = 0
+        self.pending = 0
+        self.groups = {}
+        self.pool = None
+
+    async def serve(self, host="127.0.0.1", port=SERVE_PORT):
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Cipher Terminal service on http://{host}:{port}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        import asyncio
+        self.connections += 1
+        try:
+            if self.connections > self.max_connections:
+                await self.respond(writer, 503, {"error": "Too many connections"}, keep_alive=False)
+                return
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), SERVE_IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, path, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Bad request line"}, keep_alive=False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                length = headers.get("content-length", "0") or "0"
+                if not (length.isascii() and length.isdigit()):
+                    await self.respond(writer, 400, {"error": "Bad Content-Length"}, keep_alive=False)
+                    return
+                length = int(length)
+                if length > SERVE_MAX_BODY:
+                    await self.respond(writer, 413, {"error": "Body too large"}, keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, payload = 200, await self.handle_request(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive: return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        if status == 503: head += "Retry-After: 1\r\n"
+        writer.write(head.encode("ascii") + b"\r\n" + body)
+        await writer.drain()
+
+    async def handle_request(self, method, path, body):
+        path = path.split("?", 1)[0].rstrip("/")
+        if path == "/ciphers":
+            if method != "GET": raise HTTPError(405, "Use GET")
+            return {"ciphers": [{"name": c.name, "key": c.key_desc} for c in CIPHER_REGISTRY]}
+        if path not in ("/encrypt", "/decrypt", "/generate_key"):
+            raise HTTPError(404, f"No such endpoint: {path}")
+        if method != "POST": raise HTTPError(405, "Use POST")
+        try:
+            job = json.loads(body or b"{}")
+            cipher = find_cipher(job["cipher"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPError(400, f"Bad request: {e}")
+        if path == "/generate_key":
+            key = cipher.generate_key()
+            return {"key": key, "display": cipher.format_key(key) if key is not None else "N/A"}
+        text = job.get("text")
+        if not isinstance(text, str): raise HTTPError(400, "'text' must be a string")
+        try:
+            key = job_key(cipher, job.get("key"))
+            hash(freeze_key(key))
+        except (ValueError, TypeError) as e:
+            raise HTTPError(400, str(e))
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, "Server busy")
+        self.pending += 1
+        try:
+            result = await self.submit(cipher, key, path == "/decrypt", text)
+        except Exception as e:
+            raise HTTPError(400, str(e))
+        finally:
+            self.pending -= 1
+        out = {"result": result}
+        if isinstance(job.get("key"), str) and job["key"].lower() == "random": out["key"] = key
+        return out
+
+    async def submit(self, cipher, key, decrypt, text):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        group_key = (cipher.name, freeze_key(key), decrypt)
+        group = self.groups.get(group_key)
+        if group is None:
+            group = self.groups[group_key] = {"cipher": cipher.name, "key": key, "decrypt": decrypt,
+                                              "texts": [], "futures": []}
+            group["timer"] = loop.call_later(self.batch_window, self._flush, group_key)
+        future = loop.create_future()
+        group["texts"].append(text)
+        group["futures"].append(future)
+        if len(group["texts"]) >= self.max_batch:
+            group["timer"].cancel()
+            self._flush(group_key)
+        return await future
+
+    def _restart_pool(self, broken):
+        # A dead worker poisons the whole pool; start a fresh one.
+        from concurrent.futures import ProcessPoolExecutor
+        if self.pool is not broken: return
+        broken.shutdown(wait=False)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def _flush(self, group_key):
+        import asyncio
+        from concurrent.futures.process import BrokenProcessPool
+        group = self.groups.pop(group_key, None)
+        if group is None: return
+        args = (run_text_batch, group["cipher"], group["key"], group["decrypt"], group["texts"])
+        if METRICS.installed: args = (_metered,) + args
+        loop = asyncio.get_running_loop()
+        try:
+            pool = self.pool
+            work = loop.run_in_executor(pool, *args)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            pool = self.pool
+            work = loop.run_in_executor(pool, *args)
+
+        def deliver(done):
+            error = done.exception()
+            if isinstance(error, BrokenProcessPool): self._restart_pool(pool)
+            results = _pool_result(done.result()) if error is None else None
+            for i, f in enumerate(group["futures"]):
+                if f.done(): continue
+                if error is not None: f.set_exception(error)
+                elif results[i][0]: f.set_result(results[i][1])
+                else: f.set_exception(ValueError(results[i][1]))
+        work.add_done_callback(deliver)
+
+def cmd_serve(args):
+    import asyncio
+    service = CipherService(args.workers, args.max_connections, args.max_pending,
+                            args.batch_window, args.max_batch)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def cli(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="cipher_terminal.py", description="Cipher Terminal command line tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("stream", help="encrypt or decrypt a file or stdin in chunks")
+    p.add_argument("cipher", help="cipher name, e.g. caesar, vigenere, hill")
+    p.add_argument("-k", "--key", help="key in the same format as input mode, or 'random'")
+    p.add_argument("-d", "--decrypt", action="store_true", help="decrypt instead of encrypt")
+    p.add_argument("-i", "--input", default="-", help="input file (default stdin)")
+    p.add_argument("-o", "--output", default="-", help="output file (default stdout)")
+    p.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE)
+    p.add_argument("--wrap", type=int, default=0, help="Base64 only: break output into lines of this length")
+    p.set_defaults(func=cmd_stream)
+
+    p = sub.add_parser("batch", help="run JSONL encrypt/decrypt jobs without the menu")
+    p.add_argument("-i", "--input", default="-", help="JSONL job file (default stdin)")
+    p.add_argument("-o", "--output", default="-", help="result file (default stdout)")
+    p.add_argument("-w", "--workers", type=int, help="worker processes (default: all cores, 1 = no pool)")
+    p.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="jobs per pool task")
+    p.add_argument("--unordered", action="store_true", help="write results as chunks finish, not in input order")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("identify", help="guess which cipher made each line of ciphertext")
+    p.add_argument("-i", "--input", default="-", help="one ciphertext per line (default stdin)")
+    p.add_argument("-o", "--output", default="-", help="JSONL guesses (default stdout)")
+    p.add_argument("--top", type=int, default=3, help="guesses per line")
+    p.set_defaults(func=cmd_identify)
+
+    p = sub.add_parser("generate", help="pre-generate seeded practice puzzles for every cipher")
+    p.add_argument("-n", "--count", type=int, default=100, help="puzzles per cipher (default 100)")
+    p.add_argument("-c", "--cipher", action="append", help="only this cipher (repeatable)")
+    p.add_argument("--seed", default="0", help="same seed, same puzzles")
+    p.add_argument("-o", "--output", default="puzzles.jsonl.gz", help="output file, gzipped if it ends in .gz")
+    p.add_argument("-w", "--workers", type=int, help="worker processes (default: all cores, 1 = no pool)")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("serve", help="run a local HTTP JSON service for every cipher")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=SERVE_PORT)
+    p.add_argument("-w", "--workers", type=int, help="worker processes (default: all cores)")
+    p.add_argument("--max-connections", type=int, default=256)
+    p.add_argument("--max-pending", type=int, default=1024, help="requests in flight before answering 503")
+    p.add_argument("--batch-window", type=float, default=0.002, help="seconds to wait for requests to batch")
+    p.add_argument("--max-batch", type=int, default=256)
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("bench", help="measure encrypt/decrypt throughput for every cipher")
+    p.add_argument("-c", "--cipher", action="append", help="only this cipher (repeatable)")
+    p.add_argument("--sizes", default=",".join(str(x) for x in BENCH_SIZES), help="comma separated, e.g. 50,1k,10M,100M")
+    p.add_argument("--kinds", default=",".join(BENCH_KINDS), help="letters, mixed and/or unicode")
+    p.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory run")
+    p.add_argument("--save", help="write results to this baseline file")
+    p.add_argument("--compare", help="compare against this baseline file")
+    p.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown as a fraction (default 0.10)")
+    p.set_defaults(func=cmd_bench)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli(sys.argv[1:]))
     main()